@@ -0,0 +1,258 @@
+"""Play the animated GIFs of the docs as videos in HTML.
+
+The walkthroughs of the notebooks are screen recordings saved as animated
+GIFs, which browsers download and decode in full as soon as a page loads.
+Once Sphinx has read the sources, this extension transcodes every GIF it
+references with ``ffmpeg`` to WebM (VP9) and MP4 (H.264), and extracts the
+first frame as a poster. HTML pages then show each GIF as::
+
+    <video class="animated-gif" muted loop playsinline preload="none"
+           poster="_images/x-<hash>.jpg">
+      <source src="_images/x-<hash>.webm" type="video/webm">
+      <source src="_images/x-<hash>.mp4" type="video/mp4">
+    </video>
+
+so that a page only loads the posters. A small script plays a video while it
+is in view, and pauses it once it is scrolled away; readers who prefer
+reduced motion, or have scripts disabled, get the video controls instead.
+
+The videos are transcoded in parallel and kept in ``animated_gif_cache``
+(default: ``docs/.image-cache``) under a hash of the GIF content, so every
+GIF is only transcoded once. Without ``ffmpeg`` (``animated_gif_ffmpeg``),
+the pages show the GIFs as before.
+
+"""
+import hashlib
+import html
+import os
+import shutil
+import subprocess
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from docutils import nodes
+from sphinx.util import logging
+from sphinx.util.osutil import relative_uri
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# MIME type and ffmpeg output options of every video format, in the order
+# browsers should try them. yuv420p, which every browser plays, requires even
+# dimensions.
+_EVEN = ["-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2", "-pix_fmt", "yuv420p"]
+FORMATS = {
+    "webm": (
+        "video/webm",
+        ["-c:v", "libvpx-vp9", "-crf", "40", "-b:v", "0", "-row-mt", "1"]
+        + ["-deadline", "good", "-cpu-used", "4"]
+        + _EVEN
+        + ["-f", "webm"],
+    ),
+    "mp4": (
+        "video/mp4",
+        ["-c:v", "libx264", "-crf", "26", "-preset", "slow"]
+        + _EVEN
+        + ["-movflags", "+faststart", "-f", "mp4"],
+    ),
+}
+POSTER = (
+    "jpg",
+    ["-frames:v", "1", "-c:v", "mjpeg", "-q:v", "3", "-f", "image2"],
+)
+
+SCRIPT = """\
+document.addEventListener("DOMContentLoaded", () => {
+  const videos = document.querySelectorAll("video.animated-gif");
+  if (!videos.length || !("IntersectionObserver" in window)
+      || matchMedia("(prefers-reduced-motion: reduce)").matches) {
+    return;
+  }
+  const observer = new IntersectionObserver((entries) => {
+    for (const entry of entries) {
+      if (entry.isIntersecting) {
+        entry.target.play().catch(() => {});
+      } else {
+        entry.target.pause();
+      }
+    }
+  }, {threshold: 0.25});
+  for (const video of videos) {
+    video.controls = false;
+    observer.observe(video);
+  }
+});
+"""
+
+# {GIF: {format or "poster": file name}}, of the files transcoded so far.
+_videos = {}
+# {GIF: (width, height)}, if Pillow is installed.
+_sizes = {}
+
+
+def _cache_dir(app):
+    return app.config.animated_gif_cache or os.path.join(
+        app.confdir, ".image-cache"
+    )
+
+
+def _transcode(ffmpeg, src, dest, options):
+    """Run ``ffmpeg`` to convert ``src`` into ``dest`` with ``options``."""
+    tmp = f"{dest}.tmp"
+    subprocess.run(
+        [ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", src]
+        + ["-an"]
+        + options
+        + [tmp],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    os.replace(tmp, dest)
+
+
+def _outputs(src):
+    """Return ``{format or "poster": (file name, ffmpeg options)}``."""
+    with open(src, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(src))[0]
+    outputs = {
+        fmt: (f"{stem}-{digest}.{fmt}", options)
+        for fmt, (_, options) in FORMATS.items()
+    }
+    outputs["poster"] = (f"{stem}-{digest}.{POSTER[0]}", POSTER[1])
+    return outputs
+
+
+def transcode_gifs(app, env):
+    """Transcode the GIFs that are not cached yet, in parallel."""
+    if app.builder.format != "html":
+        return
+    ffmpeg = shutil.which(app.config.animated_gif_ffmpeg)
+    if ffmpeg is None:
+        logger.info(
+            f"{app.config.animated_gif_ffmpeg} not found, serving the "
+            "animated GIFs as they are"
+        )
+        return
+    cache_dir = _cache_dir(app)
+    os.makedirs(cache_dir, exist_ok=True)
+    jobs = []
+    for uri in env.images:
+        src = os.path.join(app.srcdir, uri)
+        if not uri.lower().endswith(".gif") or src in _videos:
+            continue
+        try:
+            outputs = _outputs(src)
+            if Image is not None:
+                with Image.open(src) as image:
+                    _sizes[src] = image.size
+        except OSError as e:
+            logger.warning(f"cannot read image {uri}: {e}")
+            continue
+        _videos[src] = {}
+        for kind, (name, options) in outputs.items():
+            dest = os.path.join(cache_dir, name)
+            if os.path.exists(dest):
+                _videos[src][kind] = name
+            else:
+                jobs.append((src, kind, name, dest, options))
+    if not jobs:
+        return
+
+    logger.info(f"transcoding {len(jobs)} animated GIF videos and posters")
+    # The work happens in ffmpeg, so threads are enough to run it in parallel.
+    workers = app.config.animated_gif_jobs or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        futures = [
+            pool.submit(_transcode, ffmpeg, src, dest, options)
+            for src, _, _, dest, options in jobs
+        ]
+    for future, (src, kind, name, _, _) in zip(futures, jobs):
+        try:
+            future.result()
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"cannot transcode {src} to {kind}: {e.stderr}")
+        else:
+            _videos[src][kind] = name
+
+
+def _video_html(src, imgpath, node):
+    """Return the ``<video>`` that plays the GIF ``src`` of ``node``."""
+    names = _videos[src]
+    url = {
+        kind: f"{imgpath}/{urllib.parse.quote(name)}"
+        for kind, name in names.items()
+    }
+    classes = ["animated-gif"] + node.get("classes", [])
+    if node.get("align"):
+        classes.append(f"align-{node['align']}")
+    attributes = [
+        f'class="{" ".join(classes)}"',
+        'muted loop playsinline controls preload="none"',
+        f'poster="{url["poster"]}"',
+    ]
+    if node.get("alt"):
+        attributes.append(f'aria-label="{html.escape(node["alt"])}"')
+    style = "max-width: 100%; height: auto"
+    if node.get("width"):
+        style += f"; width: {node['width']}"
+    elif src in _sizes:
+        attributes.append('width="{}" height="{}"'.format(*_sizes[src]))
+    attributes.append(f'style="{style}"')
+    sources = "".join(
+        f'<source src="{url[fmt]}" type="{mimetype}" />'
+        for fmt, (mimetype, _) in FORMATS.items()
+        if fmt in url
+    )
+    alt = html.escape(node.get("alt", ""))
+    return (
+        f"<video {' '.join(attributes)}>{sources}"
+        f'<img src="{url["poster"]}" alt="{alt}" /></video>'
+    )
+
+
+def replace_gifs(app, doctree, docname):
+    """Replace the GIFs that have a video and a poster with the video."""
+    if app.builder.format != "html" or not _videos:
+        return
+    imgpath = relative_uri(
+        app.builder.get_target_uri(docname), app.builder.imagedir
+    )
+    for node in list(doctree.findall(nodes.image)):
+        src = os.path.join(app.srcdir, node["uri"])
+        kinds = _videos.get(src, {})
+        if "poster" not in kinds or not any(fmt in kinds for fmt in FORMATS):
+            continue
+        node.replace_self(
+            nodes.raw("", _video_html(src, imgpath, node), format="html")
+        )
+
+
+def copy_videos(app, exception):
+    """Copy the videos and posters next to the images."""
+    if exception or not _videos:
+        return
+    cache_dir = _cache_dir(app)
+    outdir = os.path.join(app.outdir, app.builder.imagedir)
+    os.makedirs(outdir, exist_ok=True)
+    for names in _videos.values():
+        for name in names.values():
+            dest = os.path.join(outdir, name)
+            if not os.path.exists(dest):
+                shutil.copyfile(os.path.join(cache_dir, name), dest)
+
+
+def setup(app):
+    app.add_config_value("animated_gif_ffmpeg", "ffmpeg", rebuild="")
+    app.add_config_value("animated_gif_cache", "", rebuild="")
+    app.add_config_value("animated_gif_jobs", 0, rebuild="")
+    app.add_js_file(None, body=SCRIPT)
+    app.connect("env-updated", transcode_gifs)
+    app.connect("doctree-resolved", replace_gifs)
+    app.connect("build-finished", copy_videos)
+    return {"parallel_read_safe": True, "parallel_write_safe": True}
@@ -0,0 +1,166 @@
+"""Record and replay the AWS API calls of the notebooks.
+
+The notebooks call AWS, e.g. ``cost_explorer.ipynb`` calls Cost Explorer, so
+they cannot be executed by an offline docs build. ``conf.py`` has the
+notebook kernels run :func:`install`, which hooks into every ``boto3``
+session. Depending on the ``BOTO3_REPLAY`` environment variable, API calls
+are then
+
+* ``replay`` (the default): answered from the fixture store, without any
+  network access or credentials. A call without a recorded response fails.
+* ``record``: sent to AWS, and their responses written to the fixture store.
+* ``off``: sent to AWS as usual.
+
+The fixture store (``BOTO3_REPLAY_DIR``, default: ``docs/fixtures/boto3``)
+holds one JSON file per call, named after the service, the operation, and a
+hash of the call parameters, e.g.
+``cost-explorer/GetCostAndUsage-<hash>.json``. Record fixtures by executing
+the notebooks with AWS credentials::
+
+    BOTO3_REPLAY=record DOCS_EXECUTE_NOTEBOOKS=1 make html
+
+"""
+import base64
+import datetime
+import hashlib
+import json
+import os
+
+DEFAULT_FIXTURE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "fixtures",
+    "boto3",
+)
+MODES = ("replay", "record", "off")
+
+
+class FixtureMissing(LookupError):
+    """Raised when replaying a call that was never recorded."""
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode()}
+    raise TypeError(f"cannot store {type(value).__name__} in a fixture")
+
+
+def _decode(obj):
+    if "__datetime__" in obj:
+        return datetime.datetime.fromisoformat(obj["__datetime__"])
+    if "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+def fixture_path(service, operation, params, fixture_dir=None):
+    """Return the fixture file of calling ``operation`` with ``params``."""
+    digest = hashlib.sha256(
+        json.dumps(params, sort_keys=True, default=_encode).encode()
+    ).hexdigest()[:16]
+    filename = f"{operation}-{digest}.json"
+    return os.path.join(fixture_dir or DEFAULT_FIXTURE_DIR, service, filename)
+
+
+class _Recorder:
+    def __init__(self, mode, fixture_dir):
+        self.mode = mode
+        self.fixture_dir = fixture_dir
+
+    def before_parameter_build(self, params, model, context, **kwargs):
+        context["boto3_replay_fixture"] = fixture_path(
+            model.service_model.service_id.hyphenize(),
+            model.name,
+            params,
+            self.fixture_dir,
+        )
+
+    def before_call(self, model, context, **kwargs):
+        if self.mode != "replay":
+            return None
+        from botocore.awsrequest import AWSResponse
+
+        path = context["boto3_replay_fixture"]
+        try:
+            with open(path) as f:
+                fixture = json.load(f, object_hook=_decode)
+        except FileNotFoundError:
+            raise FixtureMissing(
+                f"no recorded response for {model.name} in {path}; record it "
+                "with BOTO3_REPLAY=record, see docs/_ext/boto3_replay.py"
+            ) from None
+        return AWSResponse(None, 200, {}, None), fixture["response"]
+
+    def after_call(self, http_response, parsed, model, context, **kwargs):
+        if self.mode != "record" or http_response.status_code >= 300:
+            return
+        response = {
+            key: value
+            for key, value in parsed.items()
+            if key != "ResponseMetadata"
+        }
+        path = context["boto3_replay_fixture"]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(
+                {"operation": model.name, "response": response},
+                f,
+                indent=2,
+                sort_keys=True,
+                default=_encode,
+            )
+            f.write("\n")
+
+    def register(self, events):
+        events.register(
+            "before-parameter-build.*.*", self.before_parameter_build
+        )
+        events.register("before-call.*.*", self.before_call)
+        events.register("after-call.*.*", self.after_call)
+
+
+def install(mode=None, fixture_dir=None):
+    """Record or replay the API calls of every ``boto3`` session.
+
+    ``mode`` and ``fixture_dir`` default to the ``BOTO3_REPLAY`` and
+    ``BOTO3_REPLAY_DIR`` environment variables. Does nothing if ``boto3`` is
+    not installed.
+
+    """
+    mode = mode or os.environ.get("BOTO3_REPLAY") or "replay"
+    if mode not in MODES:
+        raise ValueError(f"BOTO3_REPLAY must be one of {MODES}, not {mode!r}")
+    if mode == "off":
+        return
+    try:
+        import boto3.session
+    except ImportError:
+        return
+
+    recorder = _Recorder(
+        mode, fixture_dir or os.environ.get("BOTO3_REPLAY_DIR")
+    )
+    if mode == "replay":
+        # Clients need a region to resolve their endpoint, even offline.
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    init = boto3.session.Session.__init__
+
+    def __init__(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        recorder.register(self.events)
+
+    boto3.session.Session.__init__ = __init__
+    boto3.DEFAULT_SESSION = None
+
+
+def kernel_arguments():
+    """Return the kernel arguments that run :func:`install` at startup."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    return [
+        "--IPKernelApp.exec_lines="
+        f"import sys; sys.path.insert(0, {here!r}); "
+        "import boto3_replay; boto3_replay.install()"
+    ]
+
@@ -0,0 +1,173 @@
+"""Report how long each phase of a Sphinx build takes.
+
+At the end of a build, this extension logs the time spent in each phase:
+
+* ``read``: parsing the changed sources, e.g. converting the notebooks,
+* ``env-updated``: the handlers of the ``env-updated`` event, e.g. encoding
+  the responsive images and transcoding the animated GIFs,
+* ``resolve``: resolving the references of every page to write,
+* ``write``: translating and writing the pages,
+* ``copy images``: copying the images into the output directory,
+* ``finish``: the rest of the final tasks, e.g. the search index,
+* ``build-finished``: the handlers of the ``build-finished`` event,
+* ``other``: everything else, e.g. pickling the environment,
+
+and writes them as JSON to ``build_timings_file`` (default:
+``_build/build-timings.json``), together with the number of parallel
+processes and of documents read and written. Compare a serial and a
+parallel build to see which phases benefit from ``-j``::
+
+    make html-parallel
+    cat _build/build-timings.json
+
+"""
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+PHASES = [
+    "read",
+    "env-updated",
+    "resolve",
+    "write",
+    "copy images",
+    "finish",
+    "build-finished",
+    "other",
+]
+
+_get_and_resolve_doctree = BuildEnvironment.get_and_resolve_doctree
+# {phase: seconds}, and the start times of the phases in progress.
+_timings = None
+_started = {}
+_counts = {}
+
+
+def _start(phase):
+    _started[phase] = time.perf_counter()
+
+
+def _stop(phase):
+    if _timings is not None and phase in _started:
+        _timings[phase] += time.perf_counter() - _started.pop(phase)
+
+
+def _timed(phase, method):
+    """Return ``method``, adding the time it takes to ``phase``."""
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            if _timings is not None:
+                _timings[phase] += time.perf_counter() - start
+
+    return wrapper
+
+
+def _counted(name, method):
+    """Return ``method``, counting the documents it is called with."""
+
+    def wrapper(docnames, *args, **kwargs):
+        _counts[name] = len(docnames)
+        return method(docnames, *args, **kwargs)
+
+    return wrapper
+
+
+def builder_inited(app):
+    global _timings
+    _timings = dict.fromkeys(PHASES, 0.0)
+    _started.clear()
+    _counts.clear()
+    _start("total")
+    builder = app.builder
+    # Instance attributes, so that only the builder of this build is timed.
+    builder.read = _timed("read", builder.read)
+    builder.write = _timed("write", builder.write)
+    builder.finish = _timed("finish", builder.finish)
+    if hasattr(builder, "copy_image_files"):
+        builder.copy_image_files = _timed(
+            "copy images", builder.copy_image_files
+        )
+    builder._write_serial = _counted("written", builder._write_serial)
+    builder._write_parallel = _counted("written", builder._write_parallel)
+
+
+def env_before_read_docs(app, env, docnames):
+    _counts["read"] = len(docnames)
+
+
+def env_updated_first(app, env):
+    _start("env-updated")
+
+
+def env_updated_last(app, env):
+    _stop("env-updated")
+
+
+def build_finished_first(app, exception):
+    _start("build-finished")
+
+
+def build_finished_last(app, exception):
+    if _timings is None:
+        return
+    _stop("build-finished")
+    total = time.perf_counter() - _started.pop("total")
+    timings = dict(_timings)
+    # Nested phases are reported on their own.
+    timings["read"] -= timings["env-updated"]
+    timings["write"] -= timings["resolve"]
+    timings["finish"] -= timings["copy images"]
+    timings["other"] = total - sum(timings.values())
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "builder": app.builder.name,
+        "jobs": app.parallel,
+        "read": _counts.get("read", 0),
+        "written": _counts.get("written", 0),
+        "failed": exception is not None,
+        "total": round(total, 3),
+        "phases": {phase: round(timings[phase], 3) for phase in PHASES},
+    }
+    logger.info(
+        f"build timings ({app.parallel} process(es), "
+        f"{report['read']} read, {report['written']} written): "
+        + ", ".join(
+            f"{phase} {seconds:.1f}s"
+            for phase, seconds in report["phases"].items()
+        )
+        + f", total {total:.1f}s"
+    )
+    path = app.config.build_timings_file or os.path.join(
+        os.path.dirname(app.doctreedir), "build-timings.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+
+def setup(app):
+    app.add_config_value("build_timings_file", "", rebuild="")
+    # Also called by the main process when writing in parallel.
+    BuildEnvironment.get_and_resolve_doctree = _timed(
+        "resolve", _get_and_resolve_doctree
+    )
+    app.connect("builder-inited", builder_inited)
+    app.connect("env-before-read-docs", env_before_read_docs)
+    # Around all the other handlers of these events.
+    app.connect("env-updated", env_updated_first, 0)
+    app.connect("env-updated", env_updated_last, 1000)
+    app.connect("build-finished", build_finished_first, 0)
+    app.connect("build-finished", build_finished_last, 1000)
+    return {"parallel_read_safe": True, "parallel_write_safe": True}
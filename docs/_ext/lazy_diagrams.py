@@ -0,0 +1,92 @@
+"""The ``diagram`` directive: an ``image`` that the HTML docs load lazily.
+
+It takes the same options as ``image``, plus ``:inline:`` to embed an SVG
+into the page instead of referencing it::
+
+    .. diagram:: images/component_reference/overall_architecture.png
+       :alt: overall architecture
+       :align: center
+
+With the ``.*`` wildcard instead of an extension, Sphinx picks the SVG
+rendered by ``make_diagrams.py`` for HTML, if it is committed, and falls back
+to the PNG elsewhere. HTML pages reference the image with
+``loading="lazy"``, so that the browser only fetches the diagrams that are
+scrolled into view.
+
+"""
+import os
+
+from docutils import nodes
+from docutils.parsers.rst import directives
+from docutils.parsers.rst.directives.images import Image
+
+
+class lazy_image(nodes.image):
+    pass
+
+
+class DiagramDirective(Image):
+    option_spec = dict(Image.option_spec, inline=directives.flag)
+
+    def run(self):
+        inline = "inline" in self.options
+        self.options.pop("inline", None)
+        result = super().run()
+        for idx, node in enumerate(result):
+            # The image comes wrapped in a reference when it has a :target:.
+            for image in list(node.findall(nodes.image)):
+                lazy = lazy_image(image.rawsource, **image.attributes)
+                lazy["inline"] = inline
+                if image is node:
+                    result[idx] = lazy
+                else:
+                    image.replace_self(lazy)
+        return result
+
+
+def visit_lazy_image_html(self, node):
+    uri = node["uri"]
+    if node["inline"] and uri.endswith(".svg"):
+        path = os.path.join(self.builder.srcdir, uri)
+        with open(path, encoding="utf-8") as f:
+            svg = f.read()
+        if svg.startswith("<?xml"):
+            svg = svg[svg.index("?>") + 2 :]
+        classes = " ".join(["diagram"] + node.get("classes", []))
+        self.body.append(f'<div class="{classes}">{svg}</div>\n')
+        raise nodes.SkipNode
+
+    start = len(self.body)
+    self.visit_image(node)
+    for idx in range(start, len(self.body)):
+        if self.body[idx].startswith("<img "):
+            self.body[idx] = self.body[idx].replace(
+                "<img ", '<img loading="lazy" decoding="async" ', 1
+            )
+            break
+
+
+def depart_lazy_image_html(self, node):
+    self.depart_image(node)
+
+
+def visit_lazy_image(self, node):
+    self.visit_image(node)
+
+
+def depart_lazy_image(self, node):
+    self.depart_image(node)
+
+
+def setup(app):
+    app.add_directive("diagram", DiagramDirective)
+    other = (visit_lazy_image, depart_lazy_image)
+    app.add_node(
+        lazy_image,
+        html=(visit_lazy_image_html, depart_lazy_image_html),
+        latex=other,
+        text=other,
+        man=other,
+        texinfo=other,
+    )
+    return {"parallel_read_safe": True, "parallel_write_safe": True}
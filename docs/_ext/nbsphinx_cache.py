@@ -0,0 +1,251 @@
+"""A persistent cache for the notebook conversions of ``nbsphinx``.
+
+``nbsphinx`` converts every notebook it reads to reST, running pandoc on
+each Markdown cell, and re-reads all notebooks whenever the environment is
+invalidated. This extension wraps :meth:`nbsphinx.Exporter.from_notebook_node`
+so that a conversion is stored in ``nbsphinx_cache_dir`` (default:
+``docs/.nbsphinx-cache``) and reused as long as the notebook, the conversion
+options, the pandoc, nbconvert and nbsphinx versions, and the files listed
+in ``nbsphinx_cache_dependencies`` (e.g. the fixtures that executed notebooks
+read) stay the same.
+
+When the files of ``nbsphinx_cache_dependencies`` change, every notebook is
+marked as outdated, so that an incremental build reads, and executes, the
+notebooks again even though they did not change themselves.
+
+Before Sphinx reads the changed documents, the notebooks among them whose
+conversion is not cached yet are converted in parallel, one worker process
+per notebook (``nbsphinx_cache_jobs``, default: one per CPU), so that the
+serial read phase only restores them from the cache.
+
+"""
+import hashlib
+import json
+import os
+import pickle
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import nbconvert
+import nbformat
+import nbsphinx
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+# Resources that do not affect the conversion.
+_VOLATILE_RESOURCES = {"nbsphinx_save_notebook"}
+
+_from_notebook_node = nbsphinx.Exporter.from_notebook_node
+_cache_dir = None
+_dependencies = None
+
+
+def _pandoc_version():
+    try:
+        return str(nbconvert.utils.pandoc.get_pandoc_version())
+    except nbconvert.utils.pandoc.PandocMissing:
+        return None
+
+
+def dependencies_digest(root, paths):
+    """Return a digest of the files ``paths``, and of those below them.
+
+    ``paths`` are relative to ``root``.
+
+    """
+    files = []
+    for path in (os.path.join(root, path) for path in paths):
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = [d for d in dirnames if d != "__pycache__"]
+                files.extend(os.path.join(dirpath, name) for name in filenames)
+        elif os.path.exists(path):
+            files.append(path)
+    h = hashlib.sha256()
+    for path in sorted(files):
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        h.update(f"{os.path.relpath(path, root)}\0{digest}\0".encode())
+    return h.hexdigest()
+
+
+def cache_key(exporter, nb, resources):
+    """Return the cache key of converting ``nb`` with ``exporter``."""
+    h = hashlib.sha256()
+    for part in [
+        # nbformat makes up random ids for cells without one.
+        [{k: v for k, v in cell.items() if k != "id"} for cell in nb.cells],
+        nb.metadata,
+        {
+            key: value
+            for key, value in (resources or {}).items()
+            if key not in _VOLATILE_RESOURCES
+        },
+        [
+            exporter._execute,
+            exporter._kernel_name,
+            exporter._execute_arguments,
+            exporter._allow_errors,
+            exporter._timeout,
+            exporter._codecell_lexer,
+        ],
+        [_pandoc_version(), nbconvert.__version__, nbsphinx.__version__],
+        _dependencies,
+    ]:
+        h.update(json.dumps(part, sort_keys=True, default=str).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _cache_path(key):
+    return os.path.join(_cache_dir, key[:2], f"{key}.pickle")
+
+
+def cached_from_notebook_node(self, nb, resources=None, **kw):
+    """:meth:`nbsphinx.Exporter.from_notebook_node`, cached on disk."""
+    if _cache_dir is None or kw:
+        return _from_notebook_node(self, nb, resources, **kw)
+
+    path = _cache_path(cache_key(self, nb, resources))
+    save_notebook = (resources or {}).get("nbsphinx_save_notebook")
+    try:
+        with open(path, "rb") as f:
+            rststr, out_resources, notebook = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        pass
+    else:
+        # Restore the side effect of a conversion: nbsphinx saves the
+        # (executed) notebook, and later copies it to the output directory.
+        if save_notebook:
+            with open(save_notebook, "w", encoding="utf-8") as f:
+                f.write(notebook)
+        return rststr, out_resources
+
+    rststr, out_resources = _from_notebook_node(self, nb, resources, **kw)
+    notebook = None
+    if save_notebook:
+        with open(save_notebook, encoding="utf-8") as f:
+            notebook = f.read()
+    try:
+        data = pickle.dumps((rststr, out_resources, notebook))
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return rststr, out_resources
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Parallel conversions never expose a partially written entry.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return rststr, out_resources
+
+
+def _exporter_kwargs(config):
+    return dict(
+        execute=config.nbsphinx_execute,
+        kernel_name=config.nbsphinx_kernel_name,
+        execute_arguments=config.nbsphinx_execute_arguments,
+        allow_errors=config.nbsphinx_allow_errors,
+        timeout=config.nbsphinx_timeout,
+        codecell_lexer=config.nbsphinx_codecell_lexer,
+    )
+
+
+def _resources(env, docname):
+    """Return the resources ``nbsphinx.NotebookParser`` converts with."""
+    srcdir = os.path.dirname(env.doc2path(docname))
+    auxfile = os.path.join(env.nbsphinx_auxdir, docname + ".ipynb")
+    return {
+        "metadata": {"path": srcdir},
+        "output_files_dir": os.path.relpath(env.nbsphinx_auxdir, srcdir),
+        "unique_key": re.sub("[/ ]", "_", docname),
+        "nbsphinx_docname": docname,
+        "nbsphinx_save_notebook": auxfile,
+    }
+
+
+def _prewarm_one(cache_dir, dependencies, path, resources, exporter_kwargs):
+    global _cache_dir, _dependencies
+    _cache_dir = cache_dir
+    _dependencies = dependencies
+    nb = nbformat.read(path, as_version=nbsphinx._ipynbversion)
+    os.makedirs(
+        os.path.dirname(resources["nbsphinx_save_notebook"]), exist_ok=True
+    )
+    exporter = nbsphinx.Exporter(**exporter_kwargs)
+    cached_from_notebook_node(exporter, nb, resources)
+
+
+def prewarm(app, env, docnames):
+    """Convert the notebooks about to be read in parallel, into the cache."""
+    exporter = nbsphinx.Exporter(**_exporter_kwargs(app.config))
+    jobs = []
+    for docname in docnames:
+        path = env.doc2path(docname)
+        if not path.endswith(".ipynb"):
+            continue
+        resources = _resources(env, docname)
+        nb = nbformat.read(path, as_version=nbsphinx._ipynbversion)
+        key = cache_key(exporter, nb, resources)
+        if not os.path.exists(_cache_path(key)):
+            jobs.append((path, resources))
+    if len(jobs) < 2:
+        # A single notebook is converted just as fast while it is read.
+        return
+
+    logger.info(f"converting {len(jobs)} notebooks in parallel")
+    workers = app.config.nbsphinx_cache_jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        futures = {
+            pool.submit(
+                _prewarm_one,
+                _cache_dir,
+                _dependencies,
+                path,
+                resources,
+                _exporter_kwargs(app.config),
+            ): path
+            for path, resources in jobs
+        }
+    for future, path in futures.items():
+        try:
+            future.result()
+        except Exception as e:
+            # Reading the notebook reports the error again, with context.
+            logger.debug(f"converting {path} in parallel failed: {e}")
+
+
+def env_get_outdated(app, env, added, changed, removed):
+    """Return the notebooks to read again since a dependency changed."""
+    previous = getattr(env, "nbsphinx_cache_dependencies", None)
+    env.nbsphinx_cache_dependencies = _dependencies
+    if previous is None or previous == _dependencies:
+        return []
+    return [
+        docname
+        for docname in env.found_docs
+        if docname not in added
+        and str(env.doc2path(docname)).endswith(".ipynb")
+    ]
+
+
+def config_inited(app, config):
+    global _cache_dir, _dependencies
+    _cache_dir = config.nbsphinx_cache_dir or os.path.join(
+        app.confdir, ".nbsphinx-cache"
+    )
+    _dependencies = dependencies_digest(
+        app.confdir, config.nbsphinx_cache_dependencies
+    )
+
+
+def setup(app):
+    app.setup_extension("nbsphinx")
+    app.add_config_value("nbsphinx_cache_dir", "", rebuild="")
+    app.add_config_value("nbsphinx_cache_jobs", 0, rebuild="")
+    app.add_config_value("nbsphinx_cache_dependencies", [], rebuild="")
+    nbsphinx.Exporter.from_notebook_node = cached_from_notebook_node
+    app.connect("config-inited", config_inited)
+    app.connect("env-get-outdated", env_get_outdated)
+    app.connect("env-before-read-docs", prewarm)
+    return {"parallel_read_safe": True, "parallel_write_safe": True}
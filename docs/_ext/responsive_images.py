@@ -0,0 +1,246 @@
+"""Serve downscaled WebP and AVIF variants of the raster images in HTML.
+
+Most images of the docs are full-size PNG screenshots. Once Sphinx has read
+the sources, this extension encodes every PNG and JPEG image it references
+at the widths in ``responsive_image_widths`` (never wider than the image
+itself) as WebP and, if Pillow supports it, AVIF. HTML pages then show each
+image as::
+
+    <picture>
+      <source type="image/avif" srcset="_images/x-<hash>-480w.avif 480w, ...">
+      <source type="image/webp" srcset="_images/x-<hash>-480w.webp 480w, ...">
+      <img src="_images/x.png" loading="lazy" ...>
+    </picture>
+
+so that browsers download the smallest variant that fits, and fall back to
+the original image. The ``sizes`` of each image tell browsers how wide it is
+shown: its ``:width:`` and ``:scale:``, or else its own width, but never
+wider than the content area of the theme, which ``mlops_custom_theme.css``
+lets grow with the window. Set ``responsive_image_sizes`` to use the same
+``sizes`` for every image instead. The variants are encoded in parallel and
+kept in ``responsive_image_cache`` (default: ``docs/.image-cache``) under a
+hash of the image content, so every image is only encoded once. SVG images
+are left alone, and animated GIFs are handled by ``animated_gifs``. Without
+Pillow, this extension does nothing.
+
+"""
+import hashlib
+import os
+import re
+import shutil
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+
+from docutils import nodes
+from sphinx.util import logging
+from sphinx.writers.html5 import HTML5Translator
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Pillow format, MIME type and encoder options of every variant format. The
+# slowest encoder settings save another 10-30% at 4-12 times the encoding
+# time, which is not worth it for screenshots.
+FORMATS = {
+    "avif": ("AVIF", "image/avif", {"quality": 55, "speed": 8}),
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+}
+RASTER_EXTENSIONS = (".png", ".jpg", ".jpeg")
+# Below this window width, sphinx_rtd_theme hides the navigation, and the
+# content spans the window. Above it, the navigation and the padding of the
+# content take about this many pixels.
+NARROW_WINDOW = 768
+NAVIGATION_WIDTH = 400
+_IMG_RE = re.compile(r"<img [^>]*>")
+_LENGTH_RE = re.compile(r"\s*([\d.]+)\s*(px|%)?\s*\Z")
+
+# {source image: [(format, width, variant file name)]}, largest first.
+_variants = {}
+# {source image: its width in pixels}
+_widths = {}
+
+
+def _formats():
+    return [fmt for fmt in FORMATS if fmt != "avif" or features.check("avif")]
+
+
+def _encode(src, dest, width, fmt):
+    """Encode the image ``src`` at ``width`` pixels into ``dest``."""
+    pil_format, _, options = FORMATS[fmt]
+    with Image.open(src) as image:
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), Image.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        tmp = f"{dest}.{os.getpid()}.tmp"
+        image.save(tmp, pil_format, **options)
+    os.replace(tmp, dest)
+
+
+def _plan(app, src):
+    """Return the variants of ``src``, as ``(format, width, name)``."""
+    with open(src, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    with Image.open(src) as image:
+        size = _widths[src] = image.width
+    widths = sorted(
+        {min(width, size) for width in app.config.responsive_image_widths},
+        reverse=True,
+    )
+    stem = os.path.splitext(os.path.basename(src))[0]
+    return [
+        (fmt, width, f"{stem}-{digest}-{width}w.{fmt}")
+        for fmt in _formats()
+        for width in widths
+    ]
+
+
+def _cache_dir(app):
+    return app.config.responsive_image_cache or os.path.join(
+        app.confdir, ".image-cache"
+    )
+
+
+def encode_variants(app, env):
+    """Encode the missing variants of every raster image, in parallel."""
+    if Image is None or app.builder.format != "html":
+        return
+    cache_dir = _cache_dir(app)
+    os.makedirs(cache_dir, exist_ok=True)
+    jobs = []
+    for uri in env.images:
+        src = os.path.join(app.srcdir, uri)
+        if not uri.lower().endswith(RASTER_EXTENSIONS) or src in _variants:
+            continue
+        try:
+            _variants[src] = _plan(app, src)
+        except OSError as e:
+            logger.warning(f"cannot read image {uri}: {e}")
+            continue
+        for fmt, width, name in _variants[src]:
+            dest = os.path.join(cache_dir, name)
+            if not os.path.exists(dest):
+                jobs.append((src, dest, width, fmt))
+    if not jobs:
+        return
+
+    logger.info(f"encoding {len(jobs)} responsive image variants")
+    workers = app.config.responsive_image_jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        futures = [pool.submit(_encode, *job) for job in jobs]
+    for future, (src, _, width, fmt) in zip(futures, jobs):
+        try:
+            future.result()
+        except Exception as e:
+            logger.warning(f"cannot encode {src} as {fmt} at {width}px: {e}")
+
+
+def image_sizes(node, width):
+    """Return the ``sizes`` of the image ``node``, ``width`` pixels wide."""
+    scale = node.get("scale", 100) / 100
+    match = _LENGTH_RE.match(node.get("width", ""))
+    if match and match.group(2) == "%":
+        # A share of the content area.
+        share = float(match.group(1)) * scale
+        return (
+            f"(max-width: {NARROW_WINDOW}px) {share:g}vw, "
+            f"calc({share:g}vw - {share * NAVIGATION_WIDTH / 100:g}px)"
+        )
+    if match:
+        width = float(match.group(1))
+    width = round(width * scale)
+    sizes = []
+    if width < NARROW_WINDOW:
+        sizes.append(f"(max-width: {width}px) 100vw")
+        sizes.append(f"(max-width: {NARROW_WINDOW}px) {width}px")
+    else:
+        sizes.append(f"(max-width: {NARROW_WINDOW}px) 100vw")
+    if width + NAVIGATION_WIDTH > NARROW_WINDOW:
+        sizes.append(
+            f"(max-width: {width + NAVIGATION_WIDTH}px) "
+            f"calc(100vw - {NAVIGATION_WIDTH}px)"
+        )
+    sizes.append(f"{width}px")
+    return ", ".join(sizes)
+
+
+def visit_image(self, node):
+    src = os.path.join(self.builder.srcdir, node["uri"])
+    start = len(self.body)
+    HTML5Translator.visit_image(self, node)
+    cache_dir = _cache_dir(self.builder.app)
+    variants = [
+        variant
+        for variant in _variants.get(src, ())
+        if os.path.exists(os.path.join(cache_dir, variant[2]))
+    ]
+    if not variants:
+        return
+
+    sizes = self.builder.config.responsive_image_sizes or image_sizes(
+        node, _widths[src]
+    )
+    sources = []
+    for fmt in FORMATS:
+        srcset = ", ".join(
+            f"{self.builder.imgpath}/{urllib.parse.quote(name)} {width}w"
+            for variant_fmt, width, name in variants
+            if variant_fmt == fmt
+        )
+        if srcset:
+            sources.append(
+                f'<source type="{FORMATS[fmt][1]}" srcset="{srcset}" '
+                f'sizes="{sizes}" />'
+            )
+
+    def picture(match):
+        img = match.group(0)
+        if "loading=" not in img:
+            img = img.replace("<img ", '<img loading="lazy" ', 1)
+        return f"<picture>{''.join(sources)}{img}</picture>"
+
+    for idx in range(start, len(self.body)):
+        if "<img " in self.body[idx]:
+            self.body[idx] = _IMG_RE.sub(picture, self.body[idx], count=1)
+            break
+
+
+def depart_image(self, node):
+    HTML5Translator.depart_image(self, node)
+
+
+def copy_variants(app, exception):
+    """Copy the variants of the images next to the images themselves."""
+    if exception or not _variants:
+        return
+    cache_dir = _cache_dir(app)
+    outdir = os.path.join(app.outdir, app.builder.imagedir)
+    os.makedirs(outdir, exist_ok=True)
+    for variants in _variants.values():
+        for _, _, name in variants:
+            src = os.path.join(cache_dir, name)
+            dest = os.path.join(outdir, name)
+            if os.path.exists(src) and not os.path.exists(dest):
+                shutil.copyfile(src, dest)
+
+
+def setup(app):
+    app.add_config_value(
+        "responsive_image_widths", [480, 960, 1600], rebuild="html"
+    )
+    app.add_config_value("responsive_image_sizes", "", rebuild="html")
+    app.add_config_value("responsive_image_cache", "", rebuild="")
+    app.add_config_value("responsive_image_jobs", 0, rebuild="")
+    if Image is None:
+        logger.info("Pillow is not installed, serving the original images")
+        return {"parallel_read_safe": True, "parallel_write_safe": True}
+
+    app.add_node(nodes.image, override=True, html=(visit_image, depart_image))
+    app.connect("env-updated", encode_variants)
+    app.connect("build-finished", copy_variants)
+    return {"parallel_read_safe": True, "parallel_write_safe": True}
@@ -0,0 +1,307 @@
+"""Benchmark the diagram builders of ``make_diagrams.py``.
+
+Every builder is timed, together with synthetic variants of the high-level
+architecture with N projects of M users each, to show how construction and
+layout scale with the size of a diagram::
+
+    python bench_diagrams.py --sizes 5x5,20x10
+
+The startup time, i.e. the time it takes to import ``make_diagrams`` in a
+fresh interpreter, is measured as well. Images are rendered into a temporary
+directory, with the render cache disabled. Every case runs ``--repeat``
+times and the fastest run is kept. Each benchmark run is appended as one
+JSON line to ``docs/.benchmarks/diagrams.jsonl``, together with the git
+commit and the Python and Graphviz versions, and compared to the previous
+run of the same formats and backend: cases that got slower by more than
+``--threshold`` are flagged as regressions.
+
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import make_diagrams
+
+DEFAULT_RESULTS = os.path.join(
+    make_diagrams.PWD, ".benchmarks", "diagrams.jsonl"
+)
+DEFAULT_SIZES = "5x5,10x10,20x10"
+
+# Timings below this many seconds are too noisy to flag as regressions.
+MIN_REGRESSION_SECONDS = 0.05
+
+COLUMNS = make_diagrams.PROFILE_PHASES + ["total"]
+
+
+def synthetic_projects(n_projects, n_users):
+    """Return the ``projects`` of a StudioDomain with the given size."""
+    return {
+        f"project{i:02d}": [f"user{j:02d}" for j in range(1, n_users + 1)]
+        for i in range(1, n_projects + 1)
+    }
+
+
+def parse_sizes(sizes):
+    """Parse ``"5x5,10x10"`` into ``[(5, 5), (10, 10)]``."""
+    result = []
+    for size in sizes.split(","):
+        if not size:
+            continue
+        try:
+            n_projects, n_users = (int(part) for part in size.split("x"))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"bad size {size!r}") from None
+        result.append((n_projects, n_users))
+    return result
+
+
+def benchmark_cases(sizes, only=None):
+    """Return ``[(case, builder, kwargs)]`` for every case to time."""
+    cases = [(name, name, {}) for name in make_diagrams.BUILDERS]
+    for n_projects, n_users in sizes:
+        cases.append(
+            (
+                f"high_level_architecture[{n_projects}x{n_users}]",
+                "make_high_level_architecture",
+                {"projects": synthetic_projects(n_projects, n_users)},
+            )
+        )
+    if only:
+        cases = [case for case in cases if any(s in case[0] for s in only)]
+    return cases
+
+
+def run_case(name, builder, kwargs, outdir, repeat):
+    """Time ``builder`` ``repeat`` times and return the fastest profile."""
+    best = None
+    for _ in range(repeat):
+        result = make_diagrams.render_one(
+            builder, fn=os.path.join(outdir, f"{name}.png"), **kwargs
+        )
+        if not result.ok:
+            raise RuntimeError(f"{name} failed:\n{result.error}")
+        if best is None or result.profile["total"] < best["total"]:
+            best = result.profile
+    return best
+
+
+def measure_startup(repeat):
+    """Return the fastest time to import ``make_diagrams``, in seconds."""
+    code = (
+        "import time; start = time.perf_counter(); import make_diagrams; "
+        "print(time.perf_counter() - start)"
+    )
+    return min(
+        float(
+            subprocess.run(
+                [sys.executable, "-c", code],
+                capture_output=True,
+                text=True,
+                check=True,
+                cwd=make_diagrams.PWD,
+            ).stdout
+        )
+        for _ in range(repeat)
+    )
+
+
+def git_commit():
+    """Return the current commit, suffixed with ``+dirty`` if modified."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=make_diagrams.PWD,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=make_diagrams.PWD,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}+dirty" if dirty else commit
+
+
+def load_runs(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_run(run, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(run, sort_keys=True) + "\n")
+
+
+def previous_run(runs, run):
+    """Return the last of ``runs`` that is comparable to ``run``."""
+    for other in reversed(runs):
+        if (
+            other["formats"] == run["formats"]
+            and other["backend"] == run["backend"]
+        ):
+            return other
+    return None
+
+
+def regressions(run, baseline, threshold):
+    """Return ``{case: (before, after)}`` for the cases that got slower.
+
+    The startup time is reported as the ``startup`` case.
+
+    """
+    totals = [
+        (name, baseline["cases"][name]["total"], profile["total"])
+        for name, profile in run["cases"].items()
+        if name in baseline["cases"]
+    ]
+    if baseline.get("startup") is not None:
+        totals.append(("startup", baseline["startup"], run["startup"]))
+    return {
+        name: (before, after)
+        for name, before, after in totals
+        if after > before * (1 + threshold)
+        and after - before > MIN_REGRESSION_SECONDS
+    }
+
+
+def print_run(run, baseline=None, file=sys.stdout):
+    """Print the timings of ``run``, relative to ``baseline`` if given."""
+    print(
+        f"{'case':<40}"
+        + "".join(f"{column:>11}" for column in COLUMNS)
+        + f"{'nodes':>8}{'edges':>8}"
+        + (f"{'change':>9}" if baseline else ""),
+        file=file,
+    )
+    for name, profile in run["cases"].items():
+        line = (
+            f"{name:<40}"
+            + "".join(f"{profile[column]:10.3f}s" for column in COLUMNS)
+            + f"{profile['nodes']:8d}{profile['edges']:8d}"
+        )
+        before = baseline["cases"].get(name) if baseline else None
+        if before and before["total"]:
+            change = profile["total"] / before["total"] - 1
+            line += f"{change:+9.0%}"
+        print(line, file=file)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the diagram builders of make_diagrams.py."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=parse_sizes,
+        default=DEFAULT_SIZES,
+        help="comma-separated NxM sizes of the synthetic high-level "
+        "architectures, with N projects of M users each "
+        f"(default: {DEFAULT_SIZES})",
+    )
+    parser.add_argument(
+        "--only",
+        action="append",
+        metavar="NAME",
+        help="only run the cases whose name contains NAME (repeatable)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="number of runs per case, of which the fastest is kept",
+    )
+    parser.add_argument(
+        "--formats",
+        default=make_diagrams.DEFAULT_FORMATS,
+        help="comma-separated output formats "
+        f"(default: {make_diagrams.DEFAULT_FORMATS})",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["diagrams", "dot"],
+        default="diagrams",
+        help="backend for the diagrams of spec files",
+    )
+    parser.add_argument(
+        "--results",
+        default=DEFAULT_RESULTS,
+        help="JSON lines file the benchmark runs are appended to",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown flagged as a regression (default: 0.1)",
+    )
+    parser.add_argument(
+        "--no-save",
+        action="store_true",
+        help="compare to the previous run without recording this one",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="exit with a non-zero status if there are regressions",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ["DIAGRAM_CACHE_DIR"] = ""
+    os.environ["DIAGRAM_PROFILE"] = "1"
+    os.environ["DIAGRAM_FORMATS"] = args.formats
+    os.environ["DIAGRAM_BACKEND"] = args.backend
+
+    cases = benchmark_cases(args.sizes, args.only)
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "graphviz": make_diagrams.graphviz_version(),
+        "formats": args.formats,
+        "backend": args.backend,
+        "repeat": args.repeat,
+        "startup": measure_startup(args.repeat),
+        "cases": {},
+    }
+    with tempfile.TemporaryDirectory() as outdir:
+        for name, builder, kwargs in cases:
+            start = time.perf_counter()
+            run["cases"][name] = run_case(
+                name, builder, kwargs, outdir, args.repeat
+            )
+            print(
+                f"{name:<40}{time.perf_counter() - start:8.2f}s",
+                file=sys.stderr,
+            )
+
+    baseline = previous_run(load_runs(args.results), run)
+    print(f"{'startup':<40}{run['startup']:10.3f}s")
+    print_run(run, baseline)
+    slower = regressions(run, baseline, args.threshold) if baseline else {}
+    if baseline:
+        print(f"\ncompared to {baseline['commit']} ({baseline['timestamp']})")
+    for name, (before, after) in slower.items():
+        print(f"REGRESSION  {name}: {before:.3f}s -> {after:.3f}s")
+    if not args.no_save:
+        append_run(run, args.results)
+    return 1 if slower and args.strict else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,12 @@
 # list see the documentation:
 # https://www.sphinx-doc.org/en/master/usage/configuration.html
 
+import os
+import sys
+
+# Local extensions live in _ext/.
+sys.path.insert(0, os.path.abspath("_ext"))
+
 # -- Project information -----------------------------------------------------
 
 project = "aws_enterprise_mlops_platform"
@@ -24,12 +30,28 @@ extensions = [
     "sphinx.ext.autosectionlabel",
     "sphinx.ext.extlinks",
     "nbsphinx",
-    "sphinx_rtd_theme"
+    "nbsphinx_cache",
+    "sphinx_rtd_theme",
+    "lazy_diagrams",
+    "responsive_images",
+    "animated_gifs",
+    "build_timings",
 ]
 autosectionlabel_prefix_document = True
 source_suffix = {".rst": "restructuredtext"}
 pygments_style = 'sphinx'
 
+# Notebooks are executed only if they have no outputs, or when building with
+# DOCS_EXECUTE_NOTEBOOKS=1. Their kernels answer AWS API calls from the
+# recorded responses in fixtures/, see _ext/boto3_replay.py.
+import boto3_replay  # noqa: E402
+
+if os.environ.get("DOCS_EXECUTE_NOTEBOOKS"):
+    nbsphinx_execute = "always"
+nbsphinx_execute_arguments = boto3_replay.kernel_arguments()
+# Executed notebooks read the fixtures, and import the costs package.
+nbsphinx_cache_dependencies = ["fixtures", "costs"]
+
 # URL-shortener. The example below aliases the long pandas url with pdug.
 extlinks = {
     # "pdug": (
@@ -0,0 +1,26 @@
+"""Query, aggregate, and store the AWS costs of the platform.
+
+The cost analyses of ``cost_explorer.ipynb`` build on this package, which
+lives next to the notebooks so that they can import it.
+
+"""
+from .aggregate import CostTable, aggregate, cost_frame, to_frame
+from .fetch import cost_filter, fetch_costs, project_costs
+from .ingest import CostRecord, iter_costs, pages, query, records
+from .store import CostStore
+
+__all__ = [
+    "CostRecord",
+    "CostStore",
+    "CostTable",
+    "aggregate",
+    "cost_filter",
+    "cost_frame",
+    "fetch_costs",
+    "iter_costs",
+    "pages",
+    "project_costs",
+    "query",
+    "records",
+    "to_frame",
+]
@@ -0,0 +1,138 @@
+"""Aggregate cost records into a table of periods by groups.
+
+:func:`aggregate` writes the amounts of a stream of
+:class:`~costs.ingest.CostRecord` straight into one ``float64`` array, with
+a row per group (e.g. per service, or per project and service) and a column
+per time period, in a single pass. The records are added up in batches, and
+rows as new groups appear, by doubling the array, so that building a cube of
+days by projects by services with millions of cells allocates a few arrays
+rather than a dict per day.
+:func:`to_frame` wraps the array into a ``pandas.DataFrame`` without copying
+it, with the periods as index and the groups as columns::
+
+    from costs import cost_frame, iter_costs
+
+    costs = cost_frame(iter_costs(client, start, end, ...), start, end)
+    costs.plot(kind="bar", stacked=True)
+
+Periods without costs are zero. Records of the same period and group, e.g.
+from separate queries, are summed up.
+
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# ``periods`` are the first days of the time periods, as ``datetime64[D]``,
+# ``keys`` the groups, and ``values`` the (periods, keys) array of amounts.
+CostTable = namedtuple("CostTable", ["periods", "keys", "values"])
+
+_FREQUENCIES = {"DAILY": "D", "MONTHLY": "M"}
+# Records are added up in batches of this many.
+BATCH_SIZE = 65536
+
+
+def period_starts(start, end, granularity="DAILY"):
+    """Return the first days of the time periods of a query.
+
+    Like Cost Explorer, ``start`` is inclusive and ``end`` exclusive, and
+    the first month starts at ``start``.
+
+    """
+    start = np.datetime64(str(start), "D")
+    end = np.datetime64(str(end), "D")
+    if granularity == "DAILY":
+        return np.arange(start, end)
+    if granularity == "MONTHLY":
+        months = np.arange(
+            start.astype("datetime64[M]"), end.astype("datetime64[M]") + 1
+        ).astype("datetime64[D]")
+        months = months[months < end]
+        if len(months):
+            months[0] = start
+        return months
+    raise ValueError(f"unsupported granularity {granularity!r}")
+
+
+def aggregate(
+    records, start, end, granularity="DAILY", metric="AmortizedCost"
+):
+    """Return the :class:`CostTable` of the ``metric`` of ``records``."""
+    periods = period_starts(start, end, granularity)
+    rows = {str(day): idx for idx, day in enumerate(periods)}
+    columns = {}
+    # Transposed, so that adding a group appends a row.
+    values = np.zeros((16, len(periods)))
+    # The flat positions and amounts of the records not yet added up.
+    positions = []
+    amounts = []
+
+    def flush():
+        nonlocal values
+        if len(columns) > len(values):
+            size = len(values)
+            while size < len(columns):
+                size *= 2
+            grown = np.zeros((size, len(periods)))
+            grown[: len(values)] = values
+            values = grown
+        np.add.at(
+            values.reshape(-1),
+            np.array(positions, dtype=np.intp),
+            np.array(amounts, dtype=np.float64),
+        )
+        positions.clear()
+        amounts.clear()
+
+    for record in records:
+        if record.metric != metric:
+            continue
+        column = columns.get(record.keys)
+        if column is None:
+            column = columns[record.keys] = len(columns)
+        try:
+            row = rows[record.start]
+        except KeyError:
+            raise ValueError(
+                f"cost of {record.start} outside of {start} to {end}"
+            ) from None
+        positions.append(column * len(periods) + row)
+        amounts.append(record.amount)
+        if len(positions) >= BATCH_SIZE:
+            flush()
+    flush()
+    return CostTable(periods, list(columns), values[: len(columns)].T)
+
+
+def to_frame(table, granularity="DAILY", names=None):
+    """Return ``table`` as a ``DataFrame`` that shares its values.
+
+    Groups of several keys, e.g. by project and service, become a column
+    ``MultiIndex`` with the level ``names``.
+
+    """
+    index = pd.PeriodIndex(table.periods, freq=_FREQUENCIES[granularity])
+    if any(len(keys) > 1 for keys in table.keys):
+        columns = pd.MultiIndex.from_tuples(table.keys, names=names)
+    else:
+        columns = pd.Index(
+            [keys[0] if keys else "Total" for keys in table.keys]
+        )
+    return pd.DataFrame(table.values, index=index, columns=columns, copy=False)
+
+
+def cost_frame(
+    records,
+    start,
+    end,
+    granularity="DAILY",
+    metric="AmortizedCost",
+    names=None,
+):
+    """Return the ``metric`` of ``records`` as a periods by groups table."""
+    return to_frame(
+        aggregate(records, start, end, granularity, metric),
+        granularity,
+        names,
+    )
@@ -0,0 +1,204 @@
+"""Fetch the costs of many projects at once.
+
+Each SageMaker project tags its resources with ``sagemaker:project-name``,
+and with the ``CostCenter`` entered at its creation. :func:`cost_filter`
+builds the ``Filter`` of a query from projects, cost centers, and linked
+accounts, and :func:`fetch_costs` queries the costs of every project
+concurrently, and merges them into one table of days by projects and
+services::
+
+    from costs import fetch_costs
+
+    costs = fetch_costs(
+        client,
+        "2022-05-01",
+        "2022-06-01",
+        projects=["again-mlops", "churn-mlops"],
+        cost_centers=["12345"],
+    )
+    costs["again-mlops"].plot(kind="bar", stacked=True)
+
+A ``Filter`` holds a single expression, so several conditions must be
+combined with ``And``; a dict literal with the key ``"Tags"`` twice keeps
+only the last one.
+
+Cost Explorer throttles clients that send too many requests, with a
+``LimitExceededException``. :func:`fetch_costs` sends at most
+``max_workers`` requests at a time, and retries throttled requests after an
+exponential backoff with jitter.
+
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .aggregate import cost_frame
+from .ingest import DEFAULT_METRICS, iter_costs
+
+PROJECT_TAG = "sagemaker:project-name"
+COST_CENTER_TAG = "CostCenter"
+SERVICE = {"Type": "DIMENSION", "Key": "SERVICE"}
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_ATTEMPTS = 8
+# Seconds of the first backoff, and of the longest.
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+THROTTLING_ERRORS = {
+    "LimitExceededException",
+    "RequestLimitExceeded",
+    "ThrottlingException",
+    "TooManyRequestsException",
+}
+
+
+def tag_filter(key, values):
+    """Return the expression that matches the tag ``key`` in ``values``."""
+    return {"Tags": {"Key": key, "Values": list(values)}}
+
+
+def dimension_filter(key, values):
+    """Return the expression that matches the dimension ``key``."""
+    return {"Dimensions": {"Key": key, "Values": list(values)}}
+
+
+def cost_filter(projects=(), cost_centers=(), accounts=(), expressions=()):
+    """Return the ``Filter`` of the costs of the given resources, or None.
+
+    The costs must match all of the given ``projects``, ``cost_centers``,
+    ``accounts``, and other ``expressions``, and any value of each.
+
+    """
+    conditions = []
+    if projects:
+        conditions.append(tag_filter(PROJECT_TAG, projects))
+    if cost_centers:
+        conditions.append(tag_filter(COST_CENTER_TAG, cost_centers))
+    if accounts:
+        conditions.append(dimension_filter("LINKED_ACCOUNT", accounts))
+    conditions.extend(expressions)
+    if not conditions:
+        return None
+    # Cost Explorer rejects an And of a single expression.
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"And": conditions}
+
+
+def _is_throttled(error):
+    # botocore's ClientError, without importing botocore.
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in THROTTLING_ERRORS
+
+
+class _Backoff:
+    """A Cost Explorer client that retries throttled requests."""
+
+    def __init__(self, client, max_attempts):
+        self.client = client
+        self.max_attempts = max_attempts
+
+    def get_cost_and_usage(self, **params):
+        for attempt in range(self.max_attempts):
+            try:
+                return self.client.get_cost_and_usage(**params)
+            except Exception as error:
+                if not _is_throttled(error) or (
+                    attempt + 1 == self.max_attempts
+                ):
+                    raise
+            # Full jitter, so that throttled threads do not retry together.
+            time.sleep(
+                random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+            )
+
+
+def project_costs(
+    client,
+    start,
+    end,
+    projects,
+    cost_centers=(),
+    accounts=(),
+    granularity="DAILY",
+    metrics=DEFAULT_METRICS,
+    group_by=(SERVICE,),
+    max_workers=DEFAULT_MAX_WORKERS,
+    max_attempts=DEFAULT_MAX_ATTEMPTS,
+):
+    """Yield the :class:`~costs.ingest.CostRecord` of each project.
+
+    The costs of each project are queried on their own, by ``max_workers``
+    threads, and yielded as the queries complete, with the project name
+    prepended to their ``keys``.
+
+    """
+    client = _Backoff(client, max_attempts)
+
+    def fetch(project):
+        return list(
+            iter_costs(
+                client,
+                start,
+                end,
+                granularity=granularity,
+                metrics=metrics,
+                group_by=group_by,
+                filter_=cost_filter([project], cost_centers, accounts),
+            )
+        )
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        futures = {
+            executor.submit(fetch, project): project for project in projects
+        }
+        try:
+            for future in as_completed(futures):
+                project = futures[future]
+                for record in future.result():
+                    yield record._replace(keys=(project,) + record.keys)
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def fetch_costs(
+    client,
+    start,
+    end,
+    projects,
+    cost_centers=(),
+    accounts=(),
+    granularity="DAILY",
+    metric="AmortizedCost",
+    group_by=(SERVICE,),
+    names=("project", "service"),
+    max_workers=DEFAULT_MAX_WORKERS,
+    max_attempts=DEFAULT_MAX_ATTEMPTS,
+):
+    """Return the ``metric`` of ``projects`` as a periods by groups table.
+
+    The columns are the projects and the ``group_by`` keys, e.g. services,
+    with the level ``names``. See :func:`project_costs`.
+
+    """
+    return cost_frame(
+        project_costs(
+            client,
+            start,
+            end,
+            projects,
+            cost_centers,
+            accounts,
+            granularity,
+            [metric],
+            group_by,
+            max_workers,
+            max_attempts,
+        ),
+        start,
+        end,
+        granularity,
+        metric,
+        list(names),
+    )
@@ -0,0 +1,114 @@
+"""Stream the results of Cost Explorer ``GetCostAndUsage`` queries.
+
+When a query has more results than fit into one response, e.g. a year of
+daily costs grouped by service and project, ``GetCostAndUsage`` returns the
+first page of them with a ``NextPageToken`` to request the next page with;
+reading only ``ResultsByTime`` of the first response silently drops the
+rest. :func:`iter_costs` requests the pages one after the other, and yields
+one :class:`CostRecord` per time period, group, and metric as each page
+arrives, so that memory stays flat however long the time period is::
+
+    import boto3
+    from costs import iter_costs
+
+    client = boto3.client("ce")
+    for record in iter_costs(
+        client,
+        "2022-01-01",
+        "2023-01-01",
+        group_by=[{"Type": "DIMENSION", "Key": "SERVICE"}],
+    ):
+        print(record.start, record.keys, record.amount)
+
+A page may end in the middle of the groups of a time period, so the records
+of one day can come from two consecutive pages. Time periods without any
+cost yield no record.
+
+"""
+from collections import namedtuple
+
+DEFAULT_METRICS = ("AmortizedCost",)
+
+# The cost of one metric of one group (e.g. one service) in one time period.
+# ``start`` is the first day of the period, e.g. "2022-05-27", and ``keys``
+# the values of the GroupBy dimensions and tags, empty if not grouped.
+CostRecord = namedtuple(
+    "CostRecord", ["start", "keys", "metric", "amount", "unit", "estimated"]
+)
+
+
+def query(
+    start,
+    end,
+    granularity="DAILY",
+    metrics=DEFAULT_METRICS,
+    group_by=None,
+    filter_=None,
+):
+    """Return the parameters of a ``GetCostAndUsage`` query.
+
+    ``start`` is inclusive and ``end`` exclusive, as ``"YYYY-MM-DD"`` strings
+    or dates. ``group_by`` and ``filter_`` are the ``GroupBy`` and ``Filter``
+    of the query.
+
+    """
+    params = {
+        "TimePeriod": {"Start": str(start), "End": str(end)},
+        "Granularity": granularity,
+        "Metrics": list(metrics),
+    }
+    if filter_:
+        params["Filter"] = filter_
+    if group_by:
+        params["GroupBy"] = list(group_by)
+    return params
+
+
+def pages(client, params):
+    """Yield the responses to the ``GetCostAndUsage`` query ``params``.
+
+    ``client`` is a Cost Explorer client, which has no paginator for
+    ``GetCostAndUsage``.
+
+    """
+    token = None
+    while True:
+        response = client.get_cost_and_usage(
+            **(dict(params, NextPageToken=token) if token else params)
+        )
+        yield response
+        token = response.get("NextPageToken")
+        if not token:
+            return
+
+
+def records(response):
+    """Yield the :class:`CostRecord` of a ``GetCostAndUsage`` response."""
+    for result in response["ResultsByTime"]:
+        start = result["TimePeriod"]["Start"]
+        estimated = result.get("Estimated", False)
+        # Ungrouped queries report their costs as the Total.
+        groups = result.get("Groups") or [
+            {"Keys": [], "Metrics": result.get("Total", {})}
+        ]
+        for group in groups:
+            keys = tuple(group["Keys"])
+            for metric, value in group["Metrics"].items():
+                yield CostRecord(
+                    start,
+                    keys,
+                    metric,
+                    float(value["Amount"]),
+                    value.get("Unit"),
+                    estimated,
+                )
+
+
+def iter_costs(client, start, end, **kwargs):
+    """Yield the :class:`CostRecord` of a query, page by page.
+
+    ``kwargs`` are passed on to :func:`query`.
+
+    """
+    for response in pages(client, query(start, end, **kwargs)):
+        yield from records(response)
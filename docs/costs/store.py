@@ -0,0 +1,225 @@
+"""Keep the daily costs fetched from Cost Explorer in a local SQLite file.
+
+Cost Explorer is slow, and bills every request. A :class:`CostStore` keeps
+the daily costs of every query it has fetched, so that re-running a report
+only requests the days that are new, or still mutable::
+
+    from costs import CostStore
+
+    cost_query = dict(group_by=[{"Type": "DIMENSION", "Key": "SERVICE"}])
+    with CostStore("costs.sqlite") as store:
+        store.refresh(client, "2022-01-01", "2023-01-01", **cost_query)
+        costs = store.frame("2022-01-01", "2023-01-01", **cost_query)
+
+The costs of a day keep changing for a while, e.g. as amortized costs
+settle, and Cost Explorer flags the costs that are still estimated. A day
+is final once it was fetched ``mutable_days`` (default: 3) days after it
+ended, without estimated costs; :meth:`CostStore.refresh` fetches all the
+other days of the time period again, in as few requests as possible.
+
+Queries are told apart by their parameters, except the time period, so
+that the same days of different filters or groups are stored separately.
+
+"""
+import datetime
+import hashlib
+import json
+import sqlite3
+
+import numpy as np
+
+from .aggregate import cost_frame, period_starts
+from .ingest import CostRecord, iter_costs, query
+
+DEFAULT_MUTABLE_DAYS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    query TEXT PRIMARY KEY,
+    params TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS days (
+    query TEXT NOT NULL,
+    day TEXT NOT NULL,
+    fetched TEXT NOT NULL,
+    final INTEGER NOT NULL,
+    PRIMARY KEY (query, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS costs (
+    query TEXT NOT NULL,
+    day TEXT NOT NULL,
+    keys TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    amount REAL NOT NULL,
+    unit TEXT,
+    estimated INTEGER NOT NULL,
+    PRIMARY KEY (query, day, keys, metric)
+) WITHOUT ROWID;
+"""
+
+
+def _utc_today():
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def day_ranges(days):
+    """Group the sorted ``"YYYY-MM-DD"`` ``days`` into ``(start, end)``.
+
+    ``end`` is exclusive, e.g. ``["2022-01-01", "2022-01-02"]`` gives
+    ``[("2022-01-01", "2022-01-03")]``.
+
+    """
+    ranges = []
+    for day in np.array(days, dtype="datetime64[D]"):
+        if ranges and ranges[-1][1] == day:
+            ranges[-1][1] = day + 1
+        else:
+            ranges.append([day, day + 1])
+    return [(str(start), str(end)) for start, end in ranges]
+
+
+class CostStore:
+    """The daily costs of Cost Explorer queries, in the SQLite file ``path``.
+
+    A ``path`` of ``":memory:"`` keeps the costs only as long as the store,
+    e.g. to always request them in the docs build.
+
+    The keyword arguments of the methods are the ``metrics``, ``group_by``
+    and ``filter_`` of the query, see :func:`costs.ingest.query`.
+
+    """
+
+    def __init__(self, path, mutable_days=DEFAULT_MUTABLE_DAYS):
+        self.path = path
+        self.mutable_days = mutable_days
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _query_id(self, **kwargs):
+        params = query(None, None, "DAILY", **kwargs)
+        del params["TimePeriod"]
+        text = json.dumps(params, sort_keys=True)
+        query_id = hashlib.sha256(text.encode()).hexdigest()[:16]
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO queries VALUES (?, ?)", (query_id, text)
+            )
+        return query_id
+
+    def stale_days(self, start, end, **kwargs):
+        """Return the days from ``start`` to ``end`` that are not final."""
+        final = {
+            day
+            for (day,) in self.connection.execute(
+                "SELECT day FROM days "
+                "WHERE query = ? AND day >= ? AND day < ? AND final",
+                (self._query_id(**kwargs), str(start), str(end)),
+            )
+        }
+        return [
+            str(day)
+            for day in period_starts(start, end)
+            if str(day) not in final
+        ]
+
+    def refresh(self, client, start, end, today=None, **kwargs):
+        """Fetch the days from ``start`` to ``end`` that are not final.
+
+        Returns the ``(start, end)`` time periods that were requested.
+
+        """
+        query_id = self._query_id(**kwargs)
+        # Cost Explorer days are UTC days.
+        today = np.datetime64(str(today or _utc_today()), "D")
+        ranges = day_ranges(self.stale_days(start, end, **kwargs))
+        for range_start, range_end in ranges:
+            estimated = set()
+
+            def rows():
+                for record in iter_costs(
+                    client,
+                    range_start,
+                    range_end,
+                    granularity="DAILY",
+                    **kwargs,
+                ):
+                    if record.estimated:
+                        estimated.add(record.start)
+                    yield (
+                        query_id,
+                        record.start,
+                        json.dumps(record.keys),
+                        record.metric,
+                        record.amount,
+                        record.unit,
+                        record.estimated,
+                    )
+
+            # Replace the days of the time period at once, or not at all.
+            with self.connection:
+                self.connection.execute(
+                    "DELETE FROM costs "
+                    "WHERE query = ? AND day >= ? AND day < ?",
+                    (query_id, range_start, range_end),
+                )
+                self.connection.executemany(
+                    "INSERT INTO costs VALUES (?, ?, ?, ?, ?, ?, ?)", rows()
+                )
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO days VALUES (?, ?, ?, ?)",
+                    (
+                        (
+                            query_id,
+                            str(day),
+                            str(today),
+                            # A numpy bool would be stored as a BLOB.
+                            int(
+                                day + 1 + self.mutable_days <= today
+                                and str(day) not in estimated
+                            ),
+                        )
+                        for day in period_starts(range_start, range_end)
+                    ),
+                )
+        return ranges
+
+    def records(self, start, end, **kwargs):
+        """Yield the stored :class:`~costs.ingest.CostRecord` of a query."""
+        rows = self.connection.execute(
+            "SELECT day, keys, metric, amount, unit, estimated FROM costs "
+            "WHERE query = ? AND day >= ? AND day < ? ORDER BY day",
+            (self._query_id(**kwargs), str(start), str(end)),
+        )
+        for day, keys, metric, amount, unit, estimated in rows:
+            yield CostRecord(
+                day,
+                tuple(json.loads(keys)),
+                metric,
+                amount,
+                unit,
+                bool(estimated),
+            )
+
+    def frame(self, start, end, metric="AmortizedCost", names=None, **kwargs):
+        """Return the stored ``metric`` of a query as a days by groups table.
+
+        See :func:`costs.aggregate.cost_frame`.
+
+        """
+        return cost_frame(
+            self.records(start, end, **kwargs),
+            start,
+            end,
+            "DAILY",
+            metric,
+            names,
+        )
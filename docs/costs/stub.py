@@ -0,0 +1,397 @@
+"""Answer Cost Explorer ``GetCostAndUsage`` queries with synthetic costs.
+
+The platform's accounts, and CI, have no internet access. To test and
+benchmark the cost analyses without AWS, :class:`CostExplorerStub` stands in
+for a ``boto3.client("ce")``, and generates the costs of any time period,
+grouped by any dimension or tag, at a configurable scale: every period has
+a cost for every group, e.g. every service and project. Like Cost Explorer,
+responses hold at most ``page_size`` groups, and a ``NextPageToken`` to
+request the rest with::
+
+    from costs import cost_frame, iter_costs
+    from costs.stub import CostExplorerStub
+
+    client = CostExplorerStub(services=50, tag_values=200)
+    costs = cost_frame(
+        iter_costs(
+            client,
+            "2022-01-01",
+            "2023-01-01",
+            group_by=[
+                {"Type": "DIMENSION", "Key": "SERVICE"},
+                {"Type": "TAG", "Key": "sagemaker:project-name"},
+            ],
+        ),
+        "2022-01-01",
+        "2023-01-01",
+    )
+
+The costs are deterministic: the same period and group of the same query
+always cost the same, whatever the page size. The ``Filter`` of a query is
+not evaluated, it only seeds the costs, so that e.g. each project of
+:func:`costs.fetch.fetch_costs` gets different ones.
+
+:func:`serve` answers the queries over HTTP, with the AWS JSON 1.1 protocol
+of Cost Explorer, for clients that cannot be handed the stub, e.g. a
+``boto3`` client with ``endpoint_url``. From the ``docs`` directory, serve
+them, or time paging through a year of costs, with::
+
+    python -m costs.stub serve --port 8000
+    python -m costs.stub benchmark --services 50 --tag-values 200 --http
+
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from .aggregate import cost_frame, period_starts
+from .ingest import iter_costs
+
+DEFAULT_PAGE_SIZE = 1000
+SERVICES = [
+    "Amazon SageMaker",
+    "Amazon Simple Storage Service",
+    "AWS Key Management Service",
+    "Amazon EC2 Container Registry (ECR)",
+    "AWS CodeBuild",
+    "AWS CodePipeline",
+    "AWS Lambda",
+    "AmazonCloudWatch",
+    "Amazon Elastic Compute Cloud - Compute",
+    "Amazon Virtual Private Cloud",
+]
+# Metrics that are not costs, in USD.
+USAGE_METRICS = {"UsageQuantity", "NormalizedUsageAmount"}
+
+
+class StubClientError(Exception):
+    """An error response, like the ``ClientError`` of ``botocore``."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code}: {message}")
+        self.response = {"Error": {"Code": code, "Message": message}}
+
+
+def _uniform(*keys):
+    """Return uniform floats in [0, 1), hashed from the integer ``keys``.
+
+    The keys are broadcast against each other, like ``numpy`` operands.
+
+    """
+    state = np.zeros((), np.uint64)
+    with np.errstate(over="ignore"):
+        for key in keys:
+            state = state * np.uint64(0x9E3779B97F4A7C15) + np.asarray(
+                key, np.int64
+            ).astype(np.uint64)
+            # The finalizer of splitmix64.
+            state = (state ^ (state >> np.uint64(30))) * np.uint64(
+                0xBF58476D1CE4E5B9
+            )
+            state = (state ^ (state >> np.uint64(27))) * np.uint64(
+                0x94D049BB133111EB
+            )
+            state = state ^ (state >> np.uint64(31))
+    return (state >> np.uint64(11)) / float(2**53)
+
+
+def _seed(*values):
+    text = json.dumps(values, sort_keys=True)
+    return int.from_bytes(hashlib.sha256(text.encode()).digest()[:7], "big")
+
+
+class CostExplorerStub:
+    """A Cost Explorer client with synthetic costs.
+
+    ``services`` is the number of values of the ``SERVICE`` dimension,
+    ``tag_values`` of any tag, and ``dimension_values`` of the other
+    dimensions and cost categories. Periods that start on or after
+    ``estimated_from`` are ``Estimated``, and a share ``throttle_rate`` of
+    the requests fails with a ``LimitExceededException``. ``requests``
+    counts the requests.
+
+    """
+
+    def __init__(
+        self,
+        services=len(SERVICES),
+        tag_values=10,
+        dimension_values=5,
+        page_size=DEFAULT_PAGE_SIZE,
+        seed=0,
+        estimated_from=None,
+        throttle_rate=0.0,
+    ):
+        self.services = services
+        self.tag_values = tag_values
+        self.dimension_values = dimension_values
+        self.page_size = page_size
+        self.seed = seed
+        self.estimated_from = estimated_from
+        self.throttle_rate = throttle_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def _values(self, definition):
+        kind, key = definition.get("Type"), definition.get("Key")
+        if kind == "DIMENSION" and key == "SERVICE":
+            return [
+                SERVICES[i]
+                if i < len(SERVICES)
+                else f"{SERVICES[i % len(SERVICES)]} {i // len(SERVICES)}"
+                for i in range(self.services)
+            ]
+        if kind == "TAG":
+            # Cost Explorer prefixes the tag values with the key.
+            return [f"{key}${key}-{i:04d}" for i in range(self.tag_values)]
+        if kind in ("DIMENSION", "COST_CATEGORY"):
+            return [f"{key}-{i:04d}" for i in range(self.dimension_values)]
+        raise StubClientError(
+            "ValidationException", f"unsupported GroupBy {definition!r}"
+        )
+
+    def get_cost_and_usage(self, **params):
+        with self._lock:
+            self.requests += 1
+            throttled = self._random.random() < self.throttle_rate
+        if throttled:
+            raise StubClientError("LimitExceededException", "Rate exceeded")
+        try:
+            start = params["TimePeriod"]["Start"]
+            end = params["TimePeriod"]["End"]
+            granularity = params["Granularity"]
+            metrics = params["Metrics"]
+            periods = period_starts(start, end, granularity)
+        except (KeyError, ValueError) as error:
+            raise StubClientError("ValidationException", str(error)) from None
+        definitions = params.get("GroupBy") or []
+        groups = list(
+            itertools.product(*(self._values(d) for d in definitions))
+        )
+        ends = [str(day) for day in periods[1:]] + [end]
+
+        # The page is a slice of all the (period, group) pairs.
+        offset = int(params.get("NextPageToken") or 0)
+        stop = min(offset + self.page_size, len(periods) * len(groups))
+        period_index, group_index = np.divmod(
+            np.arange(offset, stop), max(len(groups), 1)
+        )
+        days = periods[period_index].astype(np.int64)
+        # Each group has its scale, from cents to hundreds of dollars a day.
+        query_seed = _seed(self.seed, params.get("Filter"))
+        scale = np.exp(_uniform(query_seed, group_index) * 10 - 4)
+        amounts = {
+            metric: scale
+            * (0.5 + _uniform(query_seed, _seed(metric), group_index, days))
+            for metric in metrics
+        }
+
+        results = {}
+        for i, (period, group) in enumerate(zip(period_index, group_index)):
+            result = results.get(period)
+            if result is None:
+                result = results[period] = {
+                    "TimePeriod": {
+                        "Start": str(periods[period]),
+                        "End": ends[period],
+                    },
+                    "Total": {},
+                    "Groups": [],
+                    "Estimated": self.estimated_from is not None
+                    and str(periods[period]) >= str(self.estimated_from),
+                }
+            values = {
+                metric: {
+                    "Amount": f"{amounts[metric][i]:.10f}",
+                    "Unit": "N/A" if metric in USAGE_METRICS else "USD",
+                }
+                for metric in metrics
+            }
+            if definitions:
+                result["Groups"].append(
+                    {"Keys": list(groups[group]), "Metrics": values}
+                )
+            else:
+                result["Total"] = values
+
+        response = {
+            "GroupDefinitions": definitions,
+            "ResultsByTime": list(results.values()),
+            "DimensionValueAttributes": [],
+        }
+        if stop < len(periods) * len(groups):
+            response["NextPageToken"] = str(stop)
+        return response
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        target = self.headers.get("X-Amz-Target", "")
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+            if not target.endswith(".GetCostAndUsage"):
+                raise StubClientError(
+                    "UnknownOperationException", f"unsupported {target!r}"
+                )
+            status, body = 200, self.server.stub.get_cost_and_usage(**params)
+        except StubClientError as error:
+            status = 400
+            body = {
+                "__type": error.response["Error"]["Code"],
+                "message": error.response["Error"]["Message"],
+            }
+        except ValueError as error:
+            status = 400
+            body = {"__type": "SerializationException", "message": str(error)}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-amz-json-1.1")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("x-amzn-RequestId", str(uuid.uuid4()))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(stub, host="127.0.0.1", port=0):
+    """Return an HTTP server that answers with ``stub``.
+
+    Port 0 picks a free port, see ``server.server_address``. Call
+    ``server.serve_forever()``, e.g. in a thread, to answer requests, and
+    point a client at it::
+
+        client = boto3.client(
+            "ce",
+            endpoint_url=f"http://{host}:{port}",
+            region_name="us-east-1",
+            aws_access_key_id="stub",
+            aws_secret_access_key="stub",
+        )
+
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.stub = stub
+    return server
+
+
+def _client(host, port):
+    import boto3
+
+    return boto3.client(
+        "ce",
+        endpoint_url=f"http://{host}:{port}",
+        region_name="us-east-1",
+        aws_access_key_id="stub",
+        aws_secret_access_key="stub",
+    )
+
+
+def benchmark(client, stub, start, end, tags):
+    """Page through the costs of a query, and aggregate them."""
+    group_by = [{"Type": "DIMENSION", "Key": "SERVICE"}]
+    if tags:
+        group_by.append({"Type": "TAG", "Key": "sagemaker:project-name"})
+    requests = stub.requests
+    began = time.perf_counter()
+    frame = cost_frame(
+        iter_costs(client, start, end, group_by=group_by), start, end
+    )
+    seconds = time.perf_counter() - began
+    print(
+        f"{stub.requests - requests} pages, {frame.shape[0]} days by "
+        f"{frame.shape[1]} groups ({frame.size} costs) in {seconds:.2f}s, "
+        f"{frame.size / seconds:,.0f} costs/s"
+    )
+    return frame
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m costs.stub",
+        description="Answer Cost Explorer queries with synthetic costs.",
+    )
+    parser.add_argument("command", choices=["serve", "benchmark"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument(
+        "--port", type=int, default=0, help="(default: a free port)"
+    )
+    parser.add_argument("--services", type=int, default=len(SERVICES))
+    parser.add_argument("--tag-values", type=int, default=10)
+    parser.add_argument("--dimension-values", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0.0,
+        help="share of requests that fail with LimitExceededException",
+    )
+    parser.add_argument(
+        "--start", default="2022-01-01", help="benchmark: first day"
+    )
+    parser.add_argument(
+        "--end", default="2023-01-01", help="benchmark: day after the last"
+    )
+    parser.add_argument(
+        "--no-tags",
+        action="store_true",
+        help="benchmark: group by service only, not by service and project",
+    )
+    parser.add_argument(
+        "--http",
+        action="store_true",
+        help="benchmark: query the stub over HTTP with boto3",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stub = CostExplorerStub(
+        services=args.services,
+        tag_values=args.tag_values,
+        dimension_values=args.dimension_values,
+        page_size=args.page_size,
+        seed=args.seed,
+        throttle_rate=args.throttle_rate,
+    )
+    if args.command == "benchmark" and not args.http:
+        benchmark(stub, stub, args.start, args.end, not args.no_tags)
+        return 0
+    server = serve(stub, args.host, args.port)
+    host, port = server.server_address[:2]
+    if args.command == "serve":
+        print(f"serving Cost Explorer on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        benchmark(
+            _client(host, port), stub, args.start, args.end, not args.no_tags
+        )
+    finally:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
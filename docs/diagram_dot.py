@@ -0,0 +1,483 @@
+"""Lightweight DOT backend for large generated diagrams.
+
+``diagrams`` creates a full Python object per node and edge, resolves the
+icon path of every node, and routes each statement through ``graphviz``.
+This backend instead keeps a compact table of slotted records, resolves the
+icon of each node *type* once, shares one interned attribute dict (and its
+pre-rendered DOT attribute list) between all nodes and edges that look the
+same, writes the DOT text in a single pass, and runs ``dot`` once.
+
+It produces the same styling as ``diagrams`` so that both backends can render
+the graphs compiled by :mod:`diagram_spec`. The ``make_*`` builders of
+``make_diagrams.py``, and thus the diagrams of a tenant inventory, use
+``diagrams`` only. A graph can also be built directly::
+
+    graph = DotGraph(direction="LR")
+    role = graph.node("aws.security.IAMRole", "DataScientist")
+    with graph.cluster("project01"):
+        app = graph.node("aws.ml.Sagemaker", "user01\\n(App)")
+    graph.edge(role, app, label="use")
+    graph.render("images/tenant.png", "images/tenant.svg")
+
+"""
+import base64
+import contextlib
+import functools
+import importlib
+import mimetypes
+import os
+import re
+import subprocess
+import time
+import xml.etree.ElementTree as ET
+
+# The defaults of diagrams.Diagram, diagrams.Cluster, diagrams.Node and
+# diagrams.Edge, so that both backends render alike.
+GRAPH_ATTRS = {
+    "pad": "2.0",
+    "splines": "ortho",
+    "nodesep": "0.60",
+    "ranksep": "0.75",
+    "fontname": "Sans-Serif",
+    "fontsize": "15",
+    "fontcolor": "#2D3436",
+}
+NODE_ATTRS = {
+    "shape": "box",
+    "style": "rounded",
+    "fixedsize": "true",
+    "width": "1.4",
+    "height": "1.4",
+    "labelloc": "b",
+    "imagescale": "true",
+    "fontname": "Sans-Serif",
+    "fontsize": "13",
+    "fontcolor": "#2D3436",
+}
+EDGE_ATTRS = {
+    "color": "#7B8894",
+}
+CLUSTER_ATTRS = {
+    "shape": "box",
+    "style": "rounded",
+    "labeljust": "l",
+    "pencolor": "#AEB6BE",
+    "fontname": "Sans-Serif",
+    "fontsize": "12",
+}
+CLUSTER_BGCOLORS = ("#E5F5FD", "#EBF3E7", "#ECE8F6", "#FDF7E3")
+EDGE_LABEL_ATTRS = {
+    "fontcolor": "#2D3436",
+    "fontname": "Sans-Serif",
+    "fontsize": "13",
+}
+ICON_NODE_HEIGHT = 1.9
+
+# Graph attributes of draft renders: straight edges skip the edge routing,
+# which dominates the layout time of large graphs.
+DRAFT_GRAPH_ATTRS = {"splines": "line"}
+
+_DIRS = {"forward", "back", "both", "none"}
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+_HREF = f"{{{XLINK_NS}}}href"
+
+_EDGE_STMT_RE = re.compile(r"^\s*(?:\"[^\"]*\"|\w+)\s*->", re.M)
+_NODE_STMT_RE = re.compile(
+    r"^\s*(?!(?:graph|node|edge|subgraph)\b)(?:\"[^\"]*\"|\w+)\s*\[", re.M
+)
+
+
+def quote(value):
+    """Return ``value`` as a quoted DOT string.
+
+    Backslashes are escaped first, so that a value ending in ``\\`` or
+    containing ``\\"`` cannot end the string early.
+
+    """
+    value = (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+    return f'"{value}"'
+
+
+def _attr_list(attrs):
+    return " ".join(f"{key}={quote(value)}" for key, value in attrs)
+
+
+class _AttrTable:
+    """Interns attribute dicts together with their DOT attribute list.
+
+    Nodes of the same type with the same options share one entry, so a
+    diagram with thousands of nodes only holds a handful of attribute dicts.
+
+    """
+
+    __slots__ = ("_index", "dicts", "strings")
+
+    def __init__(self):
+        self._index = {}
+        self.dicts = []
+        self.strings = []
+
+    def intern(self, attrs):
+        key = tuple(sorted((k, str(v)) for k, v in attrs.items()))
+        idx = self._index.get(key)
+        if idx is None:
+            idx = self._index[key] = len(self.dicts)
+            self.dicts.append(dict(key))
+            self.strings.append(_attr_list(key))
+        return idx
+
+
+class NodeRecord:
+    __slots__ = ("label", "attrs", "cluster")
+
+    def __init__(self, label, attrs, cluster):
+        self.label = label
+        self.attrs = attrs
+        self.cluster = cluster
+
+
+class EdgeRecord:
+    __slots__ = ("tail", "head", "attrs")
+
+    def __init__(self, tail, head, attrs):
+        self.tail = tail
+        self.head = head
+        self.attrs = attrs
+
+
+class ClusterRecord:
+    __slots__ = ("label", "attrs", "parent", "depth")
+
+    def __init__(self, label, attrs, parent, depth):
+        self.label = label
+        self.attrs = attrs
+        self.parent = parent
+        self.depth = depth
+
+
+@functools.lru_cache(maxsize=None)
+def _resources_dir():
+    import diagrams
+
+    # diagrams installs its icons as a top-level "resources" directory.
+    return os.path.dirname(os.path.dirname(os.path.abspath(diagrams.__file__)))
+
+
+@functools.lru_cache(maxsize=None)
+def type_attrs(node_type):
+    """Return the node attributes implied by ``node_type``.
+
+    ``node_type`` names a ``diagrams`` node class relative to the ``diagrams``
+    package, e.g. ``aws.security.IAMRole``. Only the class is imported, once
+    per type, to look up its icon; no node object is created.
+
+    """
+    module, name = node_type.rsplit(".", 1)
+    cls = getattr(importlib.import_module(f"diagrams.{module}"), name)
+    if not getattr(cls, "_icon", None):
+        return {}
+    return {
+        "shape": "none",
+        "image": os.path.join(_resources_dir(), cls._icon_dir, cls._icon),
+    }
+
+
+class DotGraph:
+    """A diagram held as compact node, edge and cluster tables."""
+
+    def __init__(
+        self,
+        label="",
+        direction="LR",
+        graph_attr=None,
+        node_attr=None,
+        edge_attr=None,
+    ):
+        self.graph_attr = dict(GRAPH_ATTRS, label=label, rankdir=direction)
+        self.graph_attr.update(graph_attr or {})
+        self.node_attr = dict(NODE_ATTRS, **(node_attr or {}))
+        self.edge_attr = dict(EDGE_ATTRS, **(edge_attr or {}))
+        self.attrs = _AttrTable()
+        self.nodes = []
+        self.edges = []
+        self.clusters = []
+        self._cluster = None
+
+    @contextlib.contextmanager
+    def cluster(self, label, **attrs):
+        """Add the nodes created inside the ``with`` block to a cluster."""
+        parent = self._cluster
+        depth = 0 if parent is None else self.clusters[parent].depth + 1
+        cluster_attrs = dict(
+            CLUSTER_ATTRS,
+            label=label,
+            bgcolor=CLUSTER_BGCOLORS[depth % len(CLUSTER_BGCOLORS)],
+        )
+        cluster_attrs.update(attrs)
+        self.clusters.append(
+            ClusterRecord(
+                label, self.attrs.intern(cluster_attrs), parent, depth
+            )
+        )
+        self._cluster = len(self.clusters) - 1
+        try:
+            yield self._cluster
+        finally:
+            self._cluster = parent
+
+    def node(self, node_type, label="", icon=None, **attrs):
+        """Add a node and return its id.
+
+        ``node_type`` is a ``diagrams`` class name such as
+        ``aws.ml.Sagemaker``, or ``custom`` together with an ``icon`` file.
+
+        """
+        if node_type == "custom":
+            node_attrs = {"shape": "none", "image": icon}
+        else:
+            node_attrs = dict(type_attrs(node_type))
+        if node_attrs:
+            # Make room for multi-line labels below the icon, like diagrams.
+            node_attrs["height"] = str(
+                ICON_NODE_HEIGHT + 0.4 * label.count("\n")
+            )
+        node_attrs.update(attrs)
+        self.nodes.append(
+            NodeRecord(label, self.attrs.intern(node_attrs), self._cluster)
+        )
+        return len(self.nodes) - 1
+
+    def edge(self, tail, head, dir="forward", **attrs):
+        """Add an edge between the node ids ``tail`` and ``head``."""
+        if dir not in _DIRS:
+            raise ValueError(f"invalid edge direction {dir!r}")
+        edge_attrs = dict(EDGE_LABEL_ATTRS, dir=dir)
+        edge_attrs.update(attrs)
+        self.edges.append(
+            EdgeRecord(tail, head, self.attrs.intern(edge_attrs))
+        )
+
+    def source(self):
+        """Return the DOT source of the graph."""
+        strings = self.attrs.strings
+        children = [[] for _ in self.clusters]
+        members = [[] for _ in self.clusters]
+        top_nodes = []
+        for idx, cluster in enumerate(self.clusters):
+            if cluster.parent is not None:
+                children[cluster.parent].append(idx)
+        for idx, node in enumerate(self.nodes):
+            if node.cluster is None:
+                top_nodes.append(idx)
+            else:
+                members[node.cluster].append(idx)
+
+        lines = [
+            "digraph {",
+            f"\tgraph [{_attr_list(self.graph_attr.items())}]",
+            f"\tnode [{_attr_list(self.node_attr.items())}]",
+            f"\tedge [{_attr_list(self.edge_attr.items())}]",
+        ]
+
+        def emit_nodes(indices, indent):
+            for idx in indices:
+                node = self.nodes[idx]
+                attrs = f"label={quote(node.label)}"
+                if strings[node.attrs]:
+                    attrs = f"{attrs} {strings[node.attrs]}"
+                lines.append(f"{indent}n{idx} [{attrs}]")
+
+        def emit_cluster(idx, indent):
+            lines.append(f"{indent}subgraph cluster_{idx} {{")
+            attrs = strings[self.clusters[idx].attrs]
+            lines.append(f"{indent}\tgraph [{attrs}]")
+            emit_nodes(members[idx], indent + "\t")
+            for child in children[idx]:
+                emit_cluster(child, indent + "\t")
+            lines.append(f"{indent}}}")
+
+        emit_nodes(top_nodes, "\t")
+        for idx, cluster in enumerate(self.clusters):
+            if cluster.parent is None:
+                emit_cluster(idx, "\t")
+        for edge in self.edges:
+            lines.append(
+                f"\tn{edge.tail} -> n{edge.head} [{strings[edge.attrs]}]"
+            )
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def render(self, *outputs, engine="dot"):
+        """Lay out the graph once and render it into the files ``outputs``.
+
+        The output formats are taken from the file extensions.
+
+        """
+        outputs = {
+            os.path.splitext(path)[1].lstrip(".").lower(): path
+            for path in outputs
+        }
+        run_graphviz(self.source(), outputs, engine)
+
+
+def _graphviz(args, source, timeout=None):
+    return subprocess.run(
+        args, input=source, check=True, capture_output=True, timeout=timeout
+    ).stdout
+
+
+def count_elements(source):
+    """Return the number of node and edge statements in the DOT ``source``."""
+    return (
+        len(_NODE_STMT_RE.findall(source)),
+        len(_EDGE_STMT_RE.findall(source)),
+    )
+
+
+def graph_size(source):
+    """Return the number of nodes plus edges of the DOT ``source``."""
+    return sum(count_elements(source))
+
+
+def draft_source(source, attrs=None):
+    """Return ``source`` with the graph attributes of a draft render.
+
+    ``attrs`` defaults to :data:`DRAFT_GRAPH_ATTRS`. They are appended as the
+    last statement of the root graph, so they override its own attributes.
+
+    """
+    head, brace, tail = source.rstrip().rpartition("}")
+    if not brace:
+        raise ValueError("not a DOT graph")
+    attrs = _attr_list((attrs or DRAFT_GRAPH_ATTRS).items())
+    return f"{head}\tgraph [{attrs}]\n}}{tail}\n"
+
+
+def run_graphviz(source, outputs, engine="dot", timings=None, timeout=None):
+    """Render the DOT ``source`` into ``outputs`` (``{format: path}``).
+
+    With several formats, the layout is computed once as positioned DOT and
+    every format is then rendered from it by ``neato -n2``, which keeps the
+    given positions instead of laying the graph out again.
+
+    Pass a ``timings`` dict to add the seconds spent on the ``layout`` and on
+    ``encode``-ing the images to it. The two phases then run separately even
+    for a single format. Every Graphviz run is killed after ``timeout``
+    seconds, raising :class:`subprocess.TimeoutExpired`.
+
+    """
+    source = source.encode()
+    start = time.perf_counter()
+    if len(outputs) == 1 and timings is None:
+        ((outformat, output),) = outputs.items()
+        _graphviz([engine, f"-T{outformat}", "-o", output], source, timeout)
+    else:
+        layout = _graphviz([engine, "-Tdot"], source, timeout)
+        laid_out = time.perf_counter()
+        for outformat, output in outputs.items():
+            _graphviz(
+                ["neato", "-n2", f"-T{outformat}", "-o", output],
+                layout,
+                timeout,
+            )
+    if "svg" in outputs:
+        optimize_svg(outputs["svg"])
+    if timings is not None:
+        timings["layout"] = timings.get("layout", 0.0) + laid_out - start
+        timings["encode"] = (
+            timings.get("encode", 0.0) + time.perf_counter() - laid_out
+        )
+
+
+def _icon_use(image, icons, defs):
+    """Return a ``<use>`` of ``image``, embedding its icon in ``defs`` once."""
+    width, height = image.get("width"), image.get("height")
+    aspect = image.get("preserveAspectRatio")
+    key = (image.get(_HREF), width, height, aspect)
+    if key not in icons:
+        path = image.get(_HREF)
+        mimetype = mimetypes.guess_type(path)[0] or "image/png"
+        with open(path, "rb") as f:
+            data = base64.b64encode(f.read()).decode("ascii")
+        icons[key] = f"icon{len(icons)}"
+        attrs = {
+            "id": icons[key],
+            "width": width,
+            "height": height,
+            _HREF: f"data:{mimetype};base64,{data}",
+        }
+        if aspect:
+            attrs["preserveAspectRatio"] = aspect
+        ET.SubElement(defs, f"{{{SVG_NS}}}image", attrs)
+    return ET.Element(
+        f"{{{SVG_NS}}}use",
+        {_HREF: f"#{icons[key]}", "x": image.get("x"), "y": image.get("y")},
+    )
+
+
+def optimize_svg(path):
+    """Make the Graphviz SVG ``path`` self-contained and smaller, in place.
+
+    Graphviz links icons by their local path, so they are embedded as data
+    URIs instead: each distinct icon once, shared by all its nodes via
+    ``<use>``. Comments, ``<title>`` tooltips (which only hold internal node
+    ids) and indentation are dropped.
+
+    """
+    ET.register_namespace("", SVG_NS)
+    ET.register_namespace("xlink", XLINK_NS)
+    root = ET.parse(path).getroot()
+    defs = ET.Element(f"{{{SVG_NS}}}defs")
+    icons = {}
+    for parent in list(root.iter()):
+        for idx, child in enumerate(parent):
+            href = child.get(_HREF, "")
+            if (
+                child.tag == f"{{{SVG_NS}}}image"
+                and not href.startswith("data:")
+                and os.path.exists(href)
+            ):
+                parent[idx] = _icon_use(child, icons, defs)
+        for child in parent.findall(f"{{{SVG_NS}}}title"):
+            parent.remove(child)
+        if parent.text is not None and not parent.text.strip():
+            parent.text = None
+        if parent.tail is not None and not parent.tail.strip():
+            parent.tail = None
+    if icons:
+        root.insert(0, defs)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(ET.tostring(root, encoding="unicode"))
+
+
+def from_spec(graph):
+    """Convert a graph compiled by :func:`diagram_spec.load_spec`."""
+    dot_graph = DotGraph(
+        graph.label,
+        graph.direction,
+        graph.graph_attr,
+        graph.node_attr,
+        graph.edge_attr,
+    )
+    ids = {}
+
+    def build(scope):
+        for node in scope.nodes:
+            ids[node.id] = dot_graph.node(
+                node.type, node.label, node.icon, **node.attrs
+            )
+        for cluster in scope.clusters:
+            with dot_graph.cluster(cluster.label, **cluster.attrs):
+                build(cluster)
+
+    build(graph.root)
+    for edge in graph.edges:
+        dot_graph.edge(ids[edge.tail], ids[edge.head], edge.dir, **edge.attrs)
+    return dot_graph
@@ -0,0 +1,372 @@
+"""Declarative specifications of the architecture diagrams.
+
+A spec file is a YAML document that describes any number of diagrams as
+nodes, clusters and edges, instead of one Python function per diagram::
+
+    defaults:                 # merged into every diagram below
+      direction: LR
+      graph_attr: {splines: polylines}
+    styles:                   # attribute sets applied with ``use: <name>``
+      console: {fontcolor: red, pencolor: red, style: dashed}
+    diagrams:
+      C_create_user:
+        output: images/component_reference/C_create_user.png
+        nodes:
+          role: {type: aws.security.IAMRole, label: DataScienceAdmin}
+        clusters:
+          - label: AWS Management Console
+            use: console
+            nodes:
+              product: {type: aws.management.ServiceCatalog, label: ...}
+        edges:
+          - {path: role >> product, label: C.1 create user}
+
+Node types are ``diagrams`` classes named relative to the ``diagrams``
+package (``aws.security.IAMRole``), or ``custom`` together with an ``icon``
+file. An edge ``path`` chains node ids with ``>>`` (forward), ``<<`` (back)
+or ``-`` (undirected), e.g. ``a - b >> [c, d]``; its attributes apply to every
+edge of the path. Relative ``output`` and ``icon`` paths are relative to the
+spec file. Any other key of a node, cluster or edge is passed on to Graphviz.
+
+:func:`load_spec` compiles a spec file once into :class:`Graph` objects that
+all renderers share. Run ``python diagram_spec.py FILE...`` to check spec
+files without importing ``diagrams``.
+
+So far, only use-case C of the component reference is described this way.
+The other diagrams are still the ``make_*`` builders of ``make_diagrams.py``:
+the high-level architecture is generated per account, and porting a
+use-case changes its layout, see the developer guide.
+
+"""
+import functools
+import importlib
+import os
+import re
+import sys
+from collections import namedtuple
+
+import yaml
+
+Graph = namedtuple(
+    "Graph",
+    [
+        "name",
+        "label",
+        "output",
+        "direction",
+        "graph_attr",
+        "node_attr",
+        "edge_attr",
+        "root",
+        "edges",
+        "source",
+    ],
+)
+Cluster = namedtuple("Cluster", ["label", "attrs", "nodes", "clusters"])
+Node = namedtuple("Node", ["id", "type", "label", "icon", "attrs"])
+Edge = namedtuple("Edge", ["tail", "head", "dir", "attrs"])
+
+_DIAGRAM_KEYS = {
+    "output",
+    "label",
+    "direction",
+    "graph_attr",
+    "node_attr",
+    "edge_attr",
+    "nodes",
+    "clusters",
+    "edges",
+}
+_DIRECTIONS = {"TB", "BT", "LR", "RL"}
+_EDGE_OPS = {">>": "forward", "<<": "back", "-": "none"}
+_PATH_TOKEN_RE = re.compile(r"\s*(>>|<<|-|\[[^\]]*\]|[A-Za-z_]\w*)\s*")
+_NODE_ID_RE = re.compile(r"[A-Za-z_]\w*\Z")
+_TYPE_RE = re.compile(r"([a-z_]\w*\.)+[A-Z]\w*\Z")
+
+
+class SpecError(ValueError):
+    """Raised for a malformed spec file."""
+
+
+def _attrs(mapping, exclude, styles, where):
+    """Return the Graphviz attributes of ``mapping`` as strings.
+
+    Attributes of the named ``use`` style come first, so that the mapping
+    itself can override them.
+
+    """
+    attrs = {}
+    style = mapping.get("use")
+    if style is not None:
+        if style not in styles:
+            raise SpecError(f"{where}: unknown style {style!r}")
+        attrs.update(styles[style])
+    attrs.update(
+        (key, value)
+        for key, value in mapping.items()
+        if key not in exclude and key != "use"
+    )
+    return {key: str(value) for key, value in attrs.items()}
+
+
+def _parse_path(path, where):
+    """Split an edge path into node id groups and the operators between."""
+    tokens = []
+    pos = 0
+    while pos < len(path):
+        m = _PATH_TOKEN_RE.match(path, pos)
+        if m is None:
+            raise SpecError(f"{where}: cannot parse edge path {path!r}")
+        tokens.append(m.group(1))
+        pos = m.end()
+
+    groups, ops = [], []
+    for i, token in enumerate(tokens):
+        if i % 2:
+            if token not in _EDGE_OPS:
+                raise SpecError(f"{where}: expected >>, << or - in {path!r}")
+            ops.append(_EDGE_OPS[token])
+        elif token.startswith("["):
+            ids = [part.strip() for part in token[1:-1].split(",")]
+            if not all(_NODE_ID_RE.match(node_id) for node_id in ids):
+                raise SpecError(f"{where}: bad node list {token!r}")
+            groups.append(ids)
+        elif token in _EDGE_OPS:
+            raise SpecError(f"{where}: expected a node id in {path!r}")
+        else:
+            groups.append([token])
+    if len(groups) < 2 or len(groups) != len(ops) + 1:
+        raise SpecError(f"{where}: incomplete edge path {path!r}")
+    return groups, ops
+
+
+class _Compiler:
+    def __init__(self, path, styles):
+        self.path = path
+        self.basedir = os.path.dirname(os.path.abspath(path))
+        self.styles = styles
+        self.ids = set()
+
+    def _path(self, path):
+        return os.path.normpath(os.path.join(self.basedir, path))
+
+    def node(self, node_id, spec, where):
+        where = f"{where}: node {node_id!r}"
+        if not _NODE_ID_RE.match(node_id):
+            raise SpecError(f"{where}: node ids must be identifiers")
+        if node_id in self.ids:
+            raise SpecError(f"{where}: duplicate node id")
+        self.ids.add(node_id)
+        if not isinstance(spec, dict) or "type" not in spec:
+            raise SpecError(f"{where}: a node needs a type")
+
+        node_type = spec["type"]
+        icon = spec.get("icon")
+        if node_type == "custom":
+            if icon is None:
+                raise SpecError(f"{where}: custom nodes need an icon")
+            icon = self._path(icon)
+        elif not _TYPE_RE.match(node_type):
+            raise SpecError(f"{where}: bad node type {node_type!r}")
+        elif icon is not None:
+            raise SpecError(f"{where}: only custom nodes take an icon")
+        return Node(
+            node_id,
+            node_type,
+            str(spec.get("label", "")),
+            icon,
+            _attrs(spec, {"type", "label", "icon"}, self.styles, where),
+        )
+
+    def scope(self, spec, where, label=None, attrs=None):
+        nodes = [
+            self.node(node_id, node_spec, where)
+            for node_id, node_spec in (spec.get("nodes") or {}).items()
+        ]
+        clusters = []
+        for cluster in spec.get("clusters") or []:
+            if "label" not in cluster:
+                raise SpecError(f"{where}: a cluster needs a label")
+            cluster_where = f"{where}: cluster {cluster['label']!r}"
+            clusters.append(
+                self.scope(
+                    cluster,
+                    cluster_where,
+                    str(cluster["label"]),
+                    _attrs(
+                        cluster,
+                        {"label", "nodes", "clusters", "edges"},
+                        self.styles,
+                        cluster_where,
+                    ),
+                )
+            )
+        return Cluster(label, attrs or {}, nodes, clusters)
+
+    def edges(self, spec, where):
+        """Collect the edges of ``spec`` and its clusters in document order.
+
+        Clusters only group edges for readability: Graphviz draws every edge
+        at the diagram level.
+
+        """
+        edges = []
+        for edge in spec.get("edges") or []:
+            if "path" not in edge:
+                raise SpecError(f"{where}: an edge needs a path")
+            groups, ops = _parse_path(edge["path"], where)
+            attrs = _attrs(edge, {"path"}, self.styles, where)
+            for tails, op, heads in zip(groups, ops, groups[1:]):
+                for node_id in tails + heads:
+                    if node_id not in self.ids:
+                        raise SpecError(f"{where}: unknown node {node_id!r}")
+                edges.extend(
+                    Edge(tail, head, op, attrs)
+                    for tail in tails
+                    for head in heads
+                )
+        for cluster in spec.get("clusters") or []:
+            edges.extend(
+                self.edges(cluster, f"{where}: cluster {cluster['label']!r}")
+            )
+        return edges
+
+    def diagram(self, name, spec, defaults):
+        where = f"{self.path}: diagram {name!r}"
+        merged = dict(defaults)
+        merged.update(spec)
+        unknown = set(merged) - _DIAGRAM_KEYS
+        if unknown:
+            raise SpecError(f"{where}: unknown keys {sorted(unknown)}")
+        if "output" not in merged:
+            raise SpecError(f"{where}: a diagram needs an output")
+        direction = merged.get("direction", "LR")
+        if direction not in _DIRECTIONS:
+            raise SpecError(f"{where}: bad direction {direction!r}")
+
+        self.ids = set()
+        root = self.scope(merged, where)
+        return Graph(
+            name,
+            str(merged.get("label", "")),
+            self._path(merged["output"]),
+            direction,
+            _attrs(merged.get("graph_attr") or {}, (), {}, where),
+            _attrs(merged.get("node_attr") or {}, (), {}, where),
+            _attrs(merged.get("edge_attr") or {}, (), {}, where),
+            root,
+            self.edges(merged, where),
+            os.path.abspath(self.path),
+        )
+
+
+def compile_spec(path, document):
+    """Compile the parsed spec ``document`` of the file ``path``."""
+    if not isinstance(document, dict) or "diagrams" not in document:
+        raise SpecError(f"{path}: a spec needs a 'diagrams' mapping")
+    styles = document.get("styles") or {}
+    defaults = document.get("defaults") or {}
+    compiler = _Compiler(path, styles)
+    return {
+        name: compiler.diagram(name, spec, defaults)
+        for name, spec in document["diagrams"].items()
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def _load_spec(path, mtime_ns):
+    with open(path) as f:
+        return compile_spec(path, yaml.safe_load(f))
+
+
+def load_spec(path):
+    """Return ``{name: Graph}`` for every diagram of the spec file ``path``.
+
+    A spec file is parsed and compiled only once per modification.
+
+    """
+    path = os.path.abspath(path)
+    return _load_spec(path, os.stat(path).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_type(node_type):
+    """Return the ``diagrams`` node class named by ``node_type``."""
+    if node_type == "custom":
+        from diagrams.custom import Custom
+
+        return Custom
+    module, name = node_type.rsplit(".", 1)
+    return getattr(importlib.import_module(f"diagrams.{module}"), name)
+
+
+def to_diagrams(graph, diagram_cls=None, outformat=None):
+    """Render ``graph`` with the ``diagrams`` package.
+
+    ``diagram_cls`` defaults to :class:`diagrams.Diagram`, and ``outformat``
+    to the extension of the graph's output file.
+
+    """
+    from diagrams import Cluster as DiagramCluster
+    from diagrams import Diagram
+    from diagrams import Edge as DiagramEdge
+
+    filename, ext = os.path.splitext(graph.output)
+    objs = {}
+
+    def build(scope):
+        for node in scope.nodes:
+            cls = resolve_type(node.type)
+            if node.icon is not None:
+                objs[node.id] = cls(node.label, node.icon, **node.attrs)
+            else:
+                objs[node.id] = cls(node.label, **node.attrs)
+        for cluster in scope.clusters:
+            with DiagramCluster(cluster.label, graph_attr=cluster.attrs):
+                build(cluster)
+
+    with (diagram_cls or Diagram)(
+        name=graph.label,
+        filename=filename,
+        outformat=outformat or ext.lstrip(".").lower(),
+        show=False,
+        direction=graph.direction,
+        graph_attr=graph.graph_attr,
+        node_attr=graph.node_attr,
+        edge_attr=graph.edge_attr,
+    ):
+        build(graph.root)
+        for edge in graph.edges:
+            tail, head = objs[edge.tail], objs[edge.head]
+            if edge.dir == "forward":
+                tail >> DiagramEdge(**edge.attrs) >> head
+            elif edge.dir == "back":
+                tail << DiagramEdge(**edge.attrs) << head
+            else:
+                tail - DiagramEdge(**edge.attrs) - head
+
+
+def main(argv=None):
+    """Check the spec files given on the command line."""
+    failed = False
+    for path in argv if argv is not None else sys.argv[1:]:
+        try:
+            graphs = load_spec(path)
+        except (OSError, yaml.YAMLError, SpecError) as e:
+            print(f"error   {e}")
+            failed = True
+            continue
+        for graph in graphs.values():
+            print(
+                f"ok      {path}: {graph.name} "
+                f"({_count_nodes(graph.root)} nodes, {len(graph.edges)} edges)"
+            )
+    return 1 if failed else 0
+
+
+def _count_nodes(scope):
+    return len(scope.nodes) + sum(_count_nodes(c) for c in scope.clusters)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+"""Index the images of the docs, and report near-duplicates and orphans.
+
+Many screenshots are consecutive frames of the same walkthrough, and some
+images are not used by any page anymore. This script fingerprints every image
+under ``docs/images`` and reports
+
+* near-duplicates: images of the same aspect ratio of which at most
+  ``--threshold`` of the content differs, grouped into clusters, and
+* orphans: images that no ``.rst``, ``.ipynb`` or ``.py`` file of the docs
+  refers to (the Python scripts are scanned for the icons of
+  ``make_diagrams.py``)::
+
+    python image_index.py
+    python image_index.py --json image-index.json --orphans orphans.txt
+
+Every image is reduced once to a small grayscale thumbnail, its perceptual
+fingerprint, and all of them are compared with each other as ``numpy``
+batches. A pixel differs when it does so by more than ``DIFF_TOLERANCE``
+gray levels, which ignores compression noise, and the differing pixels are
+counted relative to the content of the two images, i.e. the pixels that
+differ from their background, so that two mostly white diagrams do not look
+alike. On screenshots, this tells consecutive frames apart from other
+screens much better than a 64-bit perceptual hash.
+
+Sphinx only copies the images that a page refers to into the HTML build, so
+orphans never reach the docs artifacts; they do however weigh on every clone
+of the repository. ``--orphans`` writes them to a file, one path per line,
+e.g. for ``xargs git rm < orphans.txt``, and ``--check`` exits with a
+non-zero status if there are any, e.g. in CI.
+
+This script requires ``numpy`` and ``Pillow``.
+
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import sys
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+PWD = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_IMAGE_DIR = os.path.join(PWD, "images")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".svg")
+RASTER_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif")
+SOURCE_EXTENSIONS = (".rst", ".ipynb", ".py")
+SKIP_DIRS = {"_build", ".diagram-cache", ".image-cache", ".nbsphinx-cache"}
+
+THUMBNAIL_SIZE = 64
+DIFF_TOLERANCE = 16
+# Images whose aspect ratios differ by more than this are never duplicates.
+MAX_ASPECT_RATIO = 1.1
+# Number of pixel comparisons per batch, to bound the memory.
+BATCH_SIZE = 2**24
+
+_REFERENCE_RE = re.compile(r"[\w./*-]*images/[\w./*-]+")
+# e.g. os.path.join(PWD, "images", "aws-endpoint.png") in make_diagrams.py.
+_JOIN_RE = re.compile(r"""["']images["'],\s*["']([\w./-]+)["']""")
+
+Duplicate = namedtuple("Duplicate", ["a", "b", "changed"])
+
+
+def list_images(image_dir):
+    """Return the images below ``image_dir``, sorted."""
+    paths = []
+    for dirpath, _, filenames in os.walk(image_dir):
+        paths.extend(
+            os.path.join(dirpath, name)
+            for name in filenames
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    return sorted(paths)
+
+
+def thumbnail(path):
+    """Return the grayscale thumbnail of ``path`` and its aspect ratio.
+
+    Animated GIFs are represented by their first frame.
+
+    """
+    with Image.open(path) as image:
+        aspect_ratio = image.width / image.height
+        image = image.convert("L").resize(
+            (THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS
+        )
+        return np.asarray(image, np.int16).ravel(), aspect_ratio
+
+
+def content_differences(thumbnails):
+    """Return the ``(N, N)`` shares of content that differ in ``thumbnails``.
+
+    ``thumbnails`` is a ``(N, pixels)`` array.
+
+    """
+    n, pixels = thumbnails.shape
+    background = np.array([np.bincount(row).argmax() for row in thumbnails])
+    content = np.abs(thumbnails - background[:, None]) > DIFF_TOLERANCE
+    # The pixels that are content in either of two images.
+    counts = content.sum(axis=1)
+    overlap = content.astype(np.int32) @ content.T.astype(np.int32)
+    union = np.maximum(counts[:, None] + counts[None, :] - overlap, 1)
+
+    block = max(1, BATCH_SIZE // (n * pixels))
+    changed = np.empty((n, n), np.int32)
+    for start in range(0, n, block):
+        diff = np.abs(thumbnails[start : start + block, None] - thumbnails)
+        changed[start : start + block] = np.sum(diff > DIFF_TOLERANCE, axis=2)
+    return np.minimum(changed / union, 1)
+
+
+def near_duplicates(paths, threshold):
+    """Return the pairs of raster ``paths`` that look nearly the same."""
+    paths = [
+        path for path in paths if path.lower().endswith(RASTER_EXTENSIONS)
+    ]
+    if len(paths) < 2:
+        return []
+    thumbnails, aspect_ratios = zip(*(thumbnail(path) for path in paths))
+    aspect_ratios = np.array(aspect_ratios)
+    ratios = aspect_ratios[:, None] / aspect_ratios[None, :]
+    changed = content_differences(np.stack(thumbnails))
+    candidates = (
+        (changed <= threshold)
+        & (ratios <= MAX_ASPECT_RATIO)
+        & (ratios >= 1 / MAX_ASPECT_RATIO)
+    )
+    return [
+        Duplicate(paths[i], paths[j], float(changed[i, j]))
+        for i, j in zip(*np.nonzero(np.triu(candidates, k=1)))
+    ]
+
+
+def clusters(duplicates):
+    """Group the images of ``duplicates`` into connected clusters."""
+    parent = {}
+
+    def find(path):
+        parent.setdefault(path, path)
+        while parent[path] != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    for duplicate in duplicates:
+        parent[find(duplicate.a)] = find(duplicate.b)
+    groups = {}
+    for path in parent:
+        groups.setdefault(find(path), []).append(path)
+    return sorted(sorted(group) for group in groups.values())
+
+
+def exact_duplicates(paths):
+    """Return the groups of ``paths`` with the same content."""
+    groups = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        groups.setdefault(digest, []).append(path)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def list_sources(root):
+    """Return the files below ``root`` that may refer to images."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [
+            name
+            for name in dirnames
+            if name not in SKIP_DIRS and not name.startswith(".")
+        ]
+        paths.extend(
+            os.path.join(dirpath, name)
+            for name in filenames
+            if name.endswith(SOURCE_EXTENSIONS)
+        )
+    return sorted(paths)
+
+
+def references(sources, root):
+    """Return the image paths, or patterns, that ``sources`` refer to."""
+    result = set()
+    for source in sources:
+        with open(source, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        matches = _REFERENCE_RE.findall(text) + [
+            f"images/{name}" for name in _JOIN_RE.findall(text)
+        ]
+        for match in matches:
+            # e.g. "/images/x.png" is relative to the docs root.
+            base = root if match.startswith("/") else os.path.dirname(source)
+            result.add(os.path.normpath(os.path.join(base, match.lstrip("/"))))
+    return result
+
+
+def orphans(images, refs):
+    """Return the ``images`` that none of the references ``refs`` matches."""
+    patterns = [ref for ref in refs if "*" in ref]
+    return [
+        path
+        for path in images
+        if path not in refs
+        and not any(fnmatch.fnmatch(path, pattern) for pattern in patterns)
+    ]
+
+
+def build_index(image_dir, root, threshold):
+    """Return the index of the images below ``image_dir``, as a dict."""
+    images = list_images(image_dir)
+    duplicates = near_duplicates(images, threshold)
+    unused = orphans(images, references(list_sources(root), root))
+
+    def rel(path):
+        return os.path.relpath(path, root)
+
+    return {
+        "images": len(images),
+        "bytes": sum(os.path.getsize(path) for path in images),
+        "exact_duplicates": [
+            [rel(path) for path in group] for group in exact_duplicates(images)
+        ],
+        "near_duplicates": [
+            {
+                "a": rel(duplicate.a),
+                "b": rel(duplicate.b),
+                "changed": round(duplicate.changed, 4),
+            }
+            for duplicate in duplicates
+        ],
+        "clusters": [
+            [rel(path) for path in group] for group in clusters(duplicates)
+        ],
+        "orphans": [rel(path) for path in unused],
+        "orphan_bytes": sum(os.path.getsize(path) for path in unused),
+    }
+
+
+def print_index(index, file=sys.stdout):
+    print(
+        f"{index['images']} images, {index['bytes'] / 1e6:.1f} MB",
+        file=file,
+    )
+    for group in index["exact_duplicates"]:
+        print(f"\nidentical: {', '.join(group)}", file=file)
+    if index["clusters"]:
+        print("\nnear-duplicates (changed content):", file=file)
+    for group in index["clusters"]:
+        print(f"\n  {', '.join(group)}", file=file)
+        for duplicate in index["near_duplicates"]:
+            if duplicate["a"] in group:
+                print(
+                    f"    {duplicate['a']} ~ {duplicate['b']}: "
+                    f"{duplicate['changed']:.1%}",
+                    file=file,
+                )
+    print(
+        f"\n{len(index['orphans'])} orphans, "
+        f"{index['orphan_bytes'] / 1e6:.1f} MB",
+        file=file,
+    )
+    for path in index["orphans"]:
+        print(f"  {path}", file=file)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Report near-duplicate and unreferenced docs images."
+    )
+    parser.add_argument(
+        "--images",
+        default=DEFAULT_IMAGE_DIR,
+        help="directory of the images (default: docs/images)",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.3,
+        help="maximum share of differing content of near-duplicates "
+        "(default: 0.3)",
+    )
+    parser.add_argument(
+        "--json", metavar="FILE", help="also write the index as JSON to FILE"
+    )
+    parser.add_argument(
+        "--orphans",
+        metavar="FILE",
+        help="write the unreferenced images to FILE, one path per line",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="exit with a non-zero status if there are unreferenced images",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    index = build_index(os.path.abspath(args.images), PWD, args.threshold)
+    print_index(index)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(index, f, indent=2)
+            f.write("\n")
+    if args.orphans:
+        with open(args.orphans, "w") as f:
+            f.writelines(f"{path}\n" for path in index["orphans"])
+    return 1 if index["orphans"] and args.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
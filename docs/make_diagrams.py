@@ -1,24 +1,527 @@
+import argparse
+import csv
+import functools
+import hashlib
+import importlib
+import importlib.metadata
+import inspect
+import json
+import linecache
 import os
-from itertools import count
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
+)
+from itertools import count, groupby
+
+import diagrams
+from diagrams import Cluster, Diagram, Edge, setdiagram
+
+import diagram_dot
+import diagram_spec
+
+
+class _LazyNode:
+    """A ``diagrams`` node class that is only imported when first used.
+
+    Importing a provider module, e.g. ``diagrams.aws.ml``, defines all of its
+    node classes, so rendering a single diagram only pays for the providers
+    its builder actually uses.
+
+    """
+
+    __slots__ = ("module", "name", "_cls")
 
-from diagrams import Cluster, Diagram, Edge
-from diagrams.aws.compute import ECR, LambdaFunction
-from diagrams.aws.devtools import Codebuild, Codecommit, Codepipeline
-from diagrams.aws.management import (
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+        self._cls = None
+
+    def __call__(self, *args, **kwargs):
+        if self._cls is None:
+            module = importlib.import_module(self.module)
+            self._cls = getattr(module, self.name)
+        return self._cls(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<lazy {self.module}.{self.name}>"
+
+
+def _lazy(module, *names):
+    return [_LazyNode(module, name) for name in names]
+
+
+ECR, LambdaFunction = _lazy("diagrams.aws.compute", "ECR", "LambdaFunction")
+Codebuild, Codecommit, Codepipeline = _lazy(
+    "diagrams.aws.devtools", "Codebuild", "Codecommit", "Codepipeline"
+)
+(
     Cloudformation,
     CloudformationStack,
     CloudformationTemplate,
     ParameterStore,
     ServiceCatalog,
+) = _lazy(
+    "diagrams.aws.management",
+    "Cloudformation",
+    "CloudformationStack",
+    "CloudformationTemplate",
+    "ParameterStore",
+    "ServiceCatalog",
 )
-from diagrams.aws.ml import Sagemaker
-from diagrams.aws.security import KMS, IAMRole
-from diagrams.aws.storage import S3, SimpleStorageServiceS3BucketWithObjects
-from diagrams.custom import Custom
-from diagrams.generic.blank import Blank
+(Sagemaker,) = _lazy("diagrams.aws.ml", "Sagemaker")
+KMS, IAMRole = _lazy("diagrams.aws.security", "KMS", "IAMRole")
+S3, SimpleStorageServiceS3BucketWithObjects = _lazy(
+    "diagrams.aws.storage", "S3", "SimpleStorageServiceS3BucketWithObjects"
+)
+(Custom,) = _lazy("diagrams.custom", "Custom")
+(Blank,) = _lazy("diagrams.generic.blank", "Blank")
 
 PWD = os.path.dirname(os.path.abspath(__file__))
 
+# Rendered images are stored here under their fingerprint. Point the
+# DIAGRAM_CACHE_DIR environment variable elsewhere (e.g., a directory
+# persisted between CI runs), or set it to an empty string to disable caching.
+DEFAULT_CACHE_DIR = os.path.join(PWD, ".diagram-cache")
+
+# Custom node icons are scaled down once to the node width at this resolution
+# (2x the 96 dpi of Graphviz bitmaps, for HiDPI screens), and kept in the
+# "icons" directory of the render cache.
+ICON_DPI = 192
+
+# The projects and users drawn by make_high_level_architecture(); None draws
+# the project elided.
+DEFAULT_PROJECTS = {"project01": ["user01", "user02"], "project02": None}
+
+# SVG for the HTML docs, which stays sharp at any zoom level, and PNG for
+# the builders that cannot embed SVG, e.g. LaTeX.
+DEFAULT_FORMATS = "svg,png"
+
+# Diagrams described declaratively rather than by a make_* function; only
+# use-case C so far, see diagram_spec.py.
+SPEC_FILE = os.path.join(PWD, "diagram_specs", "component_reference.yaml")
+
+# Records the inputs and outputs of every builder after its last render; see
+# stale_builders().
+DEFAULT_MANIFEST = os.path.join(PWD, ".diagram-manifest.json")
+
+# The icons of the diagrams package live below this directory. The manifest
+# records them relative to it, prefixed with DIAGRAMS_PREFIX, and the files
+# of the docs relative to PWD, so that it holds in any checkout and
+# virtualenv.
+DIAGRAMS_ROOT = os.path.dirname(
+    os.path.dirname(os.path.abspath(diagrams.__file__))
+)
+DIAGRAMS_PREFIX = "<diagrams>/"
+
+# Seconds after which a Graphviz run is killed and the diagram is rendered as
+# a draft instead (DIAGRAM_LAYOUT_TIMEOUT, 0 to wait forever).
+DEFAULT_LAYOUT_TIMEOUT = 300
+
+# Where the diagrams of a tenant inventory are written by default.
+DEFAULT_TENANT_DIR = "tenant-diagrams"
+
+# diagrams names every node with a random uuid4 hex string, which graphviz
+# quotes when it starts with a digit.
+_NODE_ID_RE = re.compile(r'"([0-9a-f]{32})"|\b([0-9a-f]{32})\b')
+_IMAGE_ATTR_RE = re.compile(r'\bimage=(?:"([^"]*)"|([^\s\],;]+))')
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _icon_digest(path):
+    # Hash each icon only once; watch() clears the cache when files change.
+    # Graphviz merely warns about a missing icon, so the diagram still
+    # renders; it is fingerprinted as missing, and rendered again once the
+    # icon exists.
+    try:
+        return _file_digest(path)
+    except FileNotFoundError:
+        return "missing"
+
+
+@functools.lru_cache(maxsize=None)
+def graphviz_version():
+    """Return the version banner of the Graphviz ``dot`` CLI."""
+    proc = subprocess.run(
+        ["dot", "-V"], capture_output=True, text=True, check=True
+    )
+    return (proc.stderr or proc.stdout).strip()
+
+
+def _icon_key(path):
+    # Scaled icons are named after the content of their original, which is
+    # located like the icons of the manifest.
+    return _relpath(_icon_sources.get(path, path))
+
+
+def canonical_source(source):
+    """Return the DOT ``source`` with the random node ids made deterministic.
+
+    Node ids are replaced by their order of first appearance, quoted or not,
+    and icon paths by their location in the docs or the diagrams package, so
+    the same diagram always produces the same canonical source, in any
+    checkout and virtualenv.
+
+    """
+    ids = {}
+    source = _IMAGE_ATTR_RE.sub(
+        lambda m: f'image="{_icon_key(m.group(1) or m.group(2))}"', source
+    )
+    return _NODE_ID_RE.sub(
+        lambda m: ids.setdefault(m.group(1) or m.group(2), f"n{len(ids)}"),
+        source,
+    )
+
+
+def icon_paths(source):
+    """Return the sorted image files referenced by the DOT ``source``."""
+    return sorted(
+        {quoted or bare for quoted, bare in _IMAGE_ATTR_RE.findall(source)}
+    )
+
+
+def diagram_fingerprint(source, engine, outformat):
+    """Fingerprint everything that determines the rendered image.
+
+    This covers the DOT source (which includes the ``graph_attr``), the
+    content of every icon file, the layout engine, the output format and the
+    Graphviz version, but not where the docs or the icons are located, see
+    :func:`canonical_source`.
+
+    """
+    h = hashlib.sha256()
+    for part in (graphviz_version(), engine, outformat):
+        h.update(part.encode())
+        h.update(b"\0")
+    h.update(canonical_source(source).encode())
+    for _, path in sorted((_icon_key(p), p) for p in icon_paths(source)):
+        h.update(b"\0")
+        h.update(_icon_digest(path).encode())
+    return h.hexdigest()
+
+
+def layout_options():
+    """Return the draft threshold, draft engine and layout timeout.
+
+    They are read from the ``DIAGRAM_DRAFT_THRESHOLD``,
+    ``DIAGRAM_DRAFT_ENGINE`` and ``DIAGRAM_LAYOUT_TIMEOUT`` environment
+    variables; a threshold or timeout of 0 disables it.
+
+    """
+    threshold = int(os.environ.get("DIAGRAM_DRAFT_THRESHOLD") or 0)
+    engine = os.environ.get("DIAGRAM_DRAFT_ENGINE") or None
+    timeout = float(
+        os.environ.get("DIAGRAM_LAYOUT_TIMEOUT", DEFAULT_LAYOUT_TIMEOUT) or 0
+    )
+    return threshold, engine, timeout or None
+
+
+def output_formats():
+    """Return the output formats, from ``DIAGRAM_FORMATS``."""
+    formats = os.environ.get("DIAGRAM_FORMATS", DEFAULT_FORMATS)
+    return [fmt.strip() for fmt in formats.split(",") if fmt.strip()]
+
+
+def render_options():
+    """Return the options that shape the rendered images.
+
+    The manifest records them for every builder, see stale_builders().
+
+    """
+    threshold, draft_engine, _ = layout_options()
+    return {
+        "formats": output_formats(),
+        "backend": os.environ.get("DIAGRAM_BACKEND", "diagrams"),
+        "draft_threshold": threshold,
+        "draft_engine": draft_engine,
+    }
+
+
+def adapt_layout(source, engine):
+    """Return the DOT source and engine to lay ``source`` out with.
+
+    Graphs with more nodes plus edges than the draft threshold are rendered
+    as drafts, with straight edges and the draft engine (e.g. ``sfdp``), if
+    any. Smaller graphs are returned unchanged.
+
+    """
+    threshold, draft_engine, _ = layout_options()
+    if threshold and diagram_dot.graph_size(source) > threshold:
+        return diagram_dot.draft_source(source), draft_engine or engine
+    return source, engine
+
+
+def run_layout(source, engine, outputs, timings=None):
+    """Run Graphviz, falling back to a draft render if the layout times out.
+
+    Returns whether the diagram was rendered as a fallback draft.
+
+    """
+    _, draft_engine, timeout = layout_options()
+    try:
+        diagram_dot.run_graphviz(source, outputs, engine, timings, timeout)
+        return False
+    except subprocess.TimeoutExpired:
+        print(
+            f"warning {', '.join(outputs.values())}: the layout took more "
+            f"than {timeout:g}s, rendering a draft",
+            file=sys.stderr,
+        )
+    diagram_dot.run_graphviz(
+        diagram_dot.draft_source(source),
+        outputs,
+        draft_engine or engine,
+        timings,
+        timeout,
+    )
+    return True
+
+
+def render_cache_dir():
+    """Return the render cache directory, or ``""`` if caching is disabled."""
+    return os.environ.get("DIAGRAM_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+
+def render_cached(source, engine, outputs, timings=None):
+    """Render the DOT ``source`` into ``outputs`` (``{format: path}``).
+
+    Every rendered image is stored in a content-addressed cache keyed by
+    :func:`diagram_fingerprint`. On a cache hit the stored image is restored
+    instead of running Graphviz, and its output file is left untouched when
+    it already has the expected content. The formats that are not cached are
+    rendered from a single Graphviz layout; ``timings`` is passed on to
+    :func:`diagram_dot.run_graphviz`.
+
+    Large graphs are laid out as drafts, see :func:`adapt_layout`. Returns
+    ``(laid_out, timed_out)``: whether Graphviz was run, i.e. an image was
+    not cached, and whether the layout timed out, in which case the diagram
+    was rendered as a draft, too, and is not cached.
+
+    """
+    source, engine = adapt_layout(source, engine)
+    cache_dir = render_cache_dir()
+    if not cache_dir:
+        return True, run_layout(source, engine, outputs, timings)
+
+    missing = {}
+    for outformat, output in outputs.items():
+        fingerprint = diagram_fingerprint(source, engine, outformat)
+        cached = os.path.join(
+            cache_dir, fingerprint[:2], f"{fingerprint}.{outformat}"
+        )
+        if not os.path.exists(cached):
+            missing[outformat] = cached
+        elif not (
+            os.path.exists(output)
+            and _file_digest(output) == _file_digest(cached)
+        ):
+            shutil.copyfile(cached, output)
+    if not missing:
+        return False, False
+
+    if run_layout(
+        source, engine, {fmt: outputs[fmt] for fmt in missing}, timings
+    ):
+        return True, True
+    for outformat, cached in missing.items():
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        # Write to a temporary name first, so that parallel renders never
+        # observe a partially copied image.
+        tmp = f"{cached}.{os.getpid()}.tmp"
+        shutil.copyfile(outputs[outformat], tmp)
+        os.replace(tmp, cached)
+    return True, False
+
+
+# The outputs, assets and profile of every diagram rendered by this process,
+# so that render_one() can report them back to the parent process.
+_rendered = []
+
+
+def _record(
+    outputs, source, construct, dot, timings, laid_out=True, timed_out=False
+):
+    """Record a rendered diagram for render_one()."""
+    nodes, edges = diagram_dot.count_elements(source)
+    _rendered.append(
+        {
+            "outputs": outputs,
+            "assets": [_icon_sources.get(p, p) for p in icon_paths(source)],
+            "profile": {
+                "construct": construct,
+                "dot": dot,
+                "layout": timings.get("layout", 0.0) if timings else 0.0,
+                "encode": timings.get("encode", 0.0) if timings else 0.0,
+                "nodes": nodes,
+                "edges": edges,
+                "layouts": int(laid_out),
+                "timeouts": int(timed_out),
+            },
+        }
+    )
+
+
+def _timings():
+    # Only split Graphviz into its layout and encode phases when profiling.
+    return {} if os.environ.get("DIAGRAM_PROFILE") else None
+
+
+class CachedDiagram(Diagram):
+    """A :class:`diagrams.Diagram` that skips ``dot`` for unchanged diagrams.
+
+    See :func:`render_cached`.
+
+    """
+
+    def __enter__(self):
+        self._entered = time.perf_counter()
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.render()
+        # Remove the graphviz file (if any) leaving only the image.
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        setdiagram(None)
+
+    def render(self):
+        construct = time.perf_counter() - self._entered
+        start = time.perf_counter()
+        source = self.dot.source
+        dot = time.perf_counter() - start
+
+        outformats = self.outformat
+        if not isinstance(outformats, list):
+            outformats = [outformats]
+        outputs = {
+            outformat: f"{self.filename}.{outformat}"
+            for outformat in outformats
+        }
+        timings = _timings()
+        laid_out, timed_out = render_cached(
+            source, self.dot.engine, outputs, timings
+        )
+        _record(
+            list(outputs.values()),
+            source,
+            construct,
+            dot,
+            timings,
+            laid_out,
+            timed_out,
+        )
+
+
+def render_spec(path, name, fn=None, outformats=None):
+    """Render the diagram ``name`` of the spec file ``path``.
+
+    ``fn`` overrides the output file given in the spec, and ``outformats``
+    the format given by its extension. The diagram is built with ``diagrams``
+    unless the ``DIAGRAM_BACKEND`` environment variable is set to ``dot``,
+    which selects the lightweight :mod:`diagram_dot` backend.
+
+    """
+    graph = diagram_spec.load_spec(path)[name]
+    if fn is not None:
+        graph = graph._replace(output=fn)
+    filename, ext = os.path.splitext(graph.output)
+    outformats = outformats or [ext.lstrip(".").lower()]
+    if os.environ.get("DIAGRAM_BACKEND", "diagrams") == "dot":
+        start = time.perf_counter()
+        dot_graph = diagram_dot.from_spec(graph)
+        constructed = time.perf_counter()
+        source = dot_graph.source()
+        dot = time.perf_counter() - constructed
+        outputs = {
+            outformat: f"{filename}.{outformat}" for outformat in outformats
+        }
+        timings = _timings()
+        laid_out, timed_out = render_cached(source, "dot", outputs, timings)
+        _record(
+            list(outputs.values()),
+            source,
+            constructed - start,
+            dot,
+            timings,
+            laid_out,
+            timed_out,
+        )
+    else:
+        diagram_spec.to_diagrams(graph, CachedDiagram, outformats)
+    # The spec file is an input of the diagram, just like its icon files.
+    _rendered[-1]["assets"].append(os.path.abspath(path))
+
+
+# The original of every icon scaled by _icon(), so that the manifest tracks
+# the files that are actually edited.
+_icon_sources = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _scaled_icon(path, mtime_ns, icon_dir):
+    try:
+        from PIL import Image
+    except ImportError:
+        return path
+
+    size = round(float(diagram_dot.NODE_ATTRS["width"]) * ICON_DPI)
+    scaled = os.path.join(icon_dir, f"{_file_digest(path)}-{size}.png")
+    if not os.path.exists(scaled):
+        with Image.open(path) as image:
+            image = image.convert("RGBA")
+            image.thumbnail((size, size), Image.LANCZOS)
+            # Logos are flat, so a palette keeps them intact and small.
+            image = image.quantize(256, method=Image.Quantize.FASTOCTREE)
+            os.makedirs(icon_dir, exist_ok=True)
+            # Parallel renders may scale the same icon; never expose a
+            # partially written file.
+            tmp = f"{scaled}.{os.getpid()}.tmp"
+            image.save(tmp, "PNG", optimize=True)
+        os.replace(tmp, scaled)
+    _icon_sources[scaled] = path
+    return scaled
+
+
+def _icon(path):
+    """Return the icon file to use for the image ``path``.
+
+    Graphviz decodes and scales an icon at full resolution for every node
+    that shows it. With Pillow installed, the image is scaled down once to
+    the node size instead, and cached under its content hash in the render
+    cache. Without Pillow, or with the render cache disabled, ``path`` is
+    used as is.
+
+    """
+    path = os.path.abspath(path)
+    cache_dir = render_cache_dir()
+    if not cache_dir:
+        return path
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        # Leave it to Graphviz to warn about the missing icon.
+        return path
+    return _scaled_icon(path, mtime_ns, os.path.join(cache_dir, "icons"))
+
 
 def make_dot(*args, **kwargs):
     return Blank(*args, shape="point", height="0.075", **kwargs)
@@ -26,20 +529,31 @@ def make_dot(*args, **kwargs):
 
 def make_vpc_endpoint(*args, **kwargs):
     return Custom(
-        *args, os.path.join(PWD, "images", "aws-endpoint.png"), **kwargs
+        *args, _icon(os.path.join(PWD, "images", "aws-endpoint.png")), **kwargs
     )
 
 
 def make_codeartifact(*args, **kwargs):
     return Custom(
-        *args, os.path.join(PWD, "images", "aws-codeartifact.png", **kwargs)
+        *args,
+        _icon(os.path.join(PWD, "images", "aws-codeartifact.png")),
+        **kwargs,
     )
 
 
 def make_high_level_architecture(
     fn="images/component_reference/overall_architecture.png",
+    outformats=None,
+    projects=None,
+    account_id="<ACCOUNT_ID>",
 ):
-    """ """
+    """High-level architecture of the platform with its use-cases A to G.
+
+    ``projects`` maps the name of each project in the StudioDomain to the
+    names of its users, or to ``None`` to draw the project elided as "...".
+    It defaults to :data:`DEFAULT_PROJECTS`.
+
+    """
 
     graph_attr = {
         "splines": "polylines"
@@ -52,7 +566,7 @@ def make_high_level_architecture(
     diagram_kwargs = {
         "name": "",
         "filename": _filename,
-        "outformat": _outformat,
+        "outformat": outformats or _outformat,
         "show": False,
         # "curvestyle": "curved",
         # "curvestyle": "ortho",
@@ -79,14 +593,21 @@ def make_high_level_architecture(
         "ECR",
     ]
 
-    account_id = "<ACCOUNT_ID>"
+    if projects is None:
+        projects = DEFAULT_PROJECTS
 
-    with Diagram(**diagram_kwargs):
+    with CachedDiagram(**diagram_kwargs):
         project_admin_role = IAMRole("ProjectAdmin")
         ds_admin_role = IAMRole("DataScienceAdmin")
         ds_user_role = IAMRole("DataScientist")
         infra_template = CloudformationTemplate("1-infra.yaml")
 
+        # The project nodes, and the products and user apps of the projects
+        # drawn in full.
+        project_nodes = []
+        products = []
+        user_apps = []
+
         with Cluster(
             f"mlops-infra-stack\naccount id: {account_id}",
             graph_attr={
@@ -100,29 +621,41 @@ def make_high_level_architecture(
                             Sagemaker("StudioDomain")
                             ds_admin_app = Sagemaker("ds-admin\n(App)")
 
-                            with Cluster("project01"):
-                                proj1 = ServiceCatalog(
-                                    label="project01\nSageMaker\nStudio User\n"
-                                    "(Product)"
-                                )
-                                create_proj1_user = Blank(
-                                    label="(C) deploy user\nvia CloudFormation",
-                                    labelloc="c",
-                                    height="0.5",
-                                )
-                                u1p1_app = Sagemaker("user01-project01\n(App)")
-                                u2p1_app = Sagemaker("user02-project01\n(App)")
-
-                                (
-                                    proj1 - Edge() - create_proj1_user
-                                    >> Edge()
-                                    >> [u1p1_app, u2p1_app]
-                                )
-
-                            with Cluster("project02"):
-                                proj2 = Blank(
-                                    label="...", labelloc="c", height="0.5"
-                                )
+                            for project, users in projects.items():
+                                with Cluster(project):
+                                    if users is None:
+                                        project_nodes.append(
+                                            Blank(
+                                                label="...",
+                                                labelloc="c",
+                                                height="0.5",
+                                            )
+                                        )
+                                        continue
+
+                                    product = ServiceCatalog(
+                                        label=f"{project}\nSageMaker\n"
+                                        "Studio User\n(Product)"
+                                    )
+                                    create_user = Blank(
+                                        label="(C) deploy user\n"
+                                        "via CloudFormation",
+                                        labelloc="c",
+                                        height="0.5",
+                                    )
+                                    apps = [
+                                        Sagemaker(f"{user}-{project}\n(App)")
+                                        for user in users
+                                    ]
+
+                                    (
+                                        product - Edge() - create_user
+                                        >> Edge()
+                                        >> apps
+                                    )
+                                    project_nodes.append(product)
+                                    products.append(product)
+                                    user_apps.extend(apps)
 
                             create_project = Blank(
                                 label="(B) deploy project\n via CloudFormation",
@@ -130,10 +663,10 @@ def make_high_level_architecture(
                                 height="0.5",
                             )
 
-                            ds_admin_app - Edge() - create_project >> [
-                                proj1,
-                                proj2,
-                            ]
+                            (
+                                ds_admin_app - Edge() - create_project
+                                >> project_nodes
+                            )
 
                     with Cluster("VPCEndpointSecurityGroup"):
                         vpc_endpoints = make_vpc_endpoint("VPC Endpoints")
@@ -161,14 +694,7 @@ def make_high_level_architecture(
             )
 
             vpc_endpoints - Edge(penwidth="3") - resources
-            (
-                [
-                    u1p1_app,
-                    u2p1_app,
-                ]
-                - Edge(penwidth="3")
-                - vpc_endpoints
-            )
+            user_apps - Edge(penwidth="3") - vpc_endpoints
 
             mlops_codeartifact = make_codeartifact(
                 "mlops-codeartifact-repository"
@@ -191,15 +717,16 @@ def make_high_level_architecture(
                 >> mlops_infra_stack
             )
 
-            (
-                ds_admin_role
-                - Edge(
-                    label="Use Case C:\nAs a Data Science Admin,\nCreate a "
-                    "User of the\nproject for a Data Scientist",
-                    style="dashed",
+            if products:
+                (
+                    ds_admin_role
+                    - Edge(
+                        label="Use Case C:\nAs a Data Science Admin,\nCreate "
+                        "a User of the\nproject for a Data Scientist",
+                        style="dashed",
+                    )
+                    >> products[0]
                 )
-                >> proj1
-            )
 
         use_case_dot = Blank(shape="point", height="0.05")
         use_case_d = Blank(
@@ -228,46 +755,50 @@ def make_high_level_architecture(
             use_case_e,
             use_case_f,
             use_case_g,
-        ] - Edge(style="dashed",) - use_case_dot - Edge(style="dashed") >> [
-            u1p1_app,
-            u2p1_app,
-        ]
-
-        with Cluster("project01 Resources"):
-            proj1_bucket = SimpleStorageServiceS3BucketWithObjects(
-                f"project01-{account_id}"
-            )
-            proj1_kms = KMS("alias: project01")
-            proj1_ssm = ParameterStore("/mlops/projects/project01/*")
-            proj1_codebuild = Codebuild("CodeBuild")
-            proj1_sagemaker = Sagemaker("SageMaker")
-            proj1_codepipeline = Codepipeline("CodePipeline")
-
-        (
-            use_case_f
-            >> Edge(
-                label="(F) Manually approve deployment\nvia AWS CodePipeline "
-                "console",
-            )
-            >> proj1_codepipeline
-        )
-
-        with Cluster("project02 Resources"):
-            proj2_resources = Blank(label="...", labelloc="c", height="0.5")
+        ] - Edge(style="dashed",) - use_case_dot - Edge(
+            style="dashed"
+        ) >> user_apps
+
+        project_resources = []
+        approve_deployment = True
+        for project, users in projects.items():
+            with Cluster(f"{project} Resources"):
+                if users is None:
+                    project_resources.append(
+                        Blank(label="...", labelloc="c", height="0.5")
+                    )
+                    continue
+
+                bucket = SimpleStorageServiceS3BucketWithObjects(
+                    f"{project}-{account_id}"
+                )
+                kms = KMS(f"alias: {project}")
+                ssm = ParameterStore(f"/mlops/projects/{project}/*")
+                codebuild = Codebuild("CodeBuild")
+                sagemaker = Sagemaker("SageMaker")
+                codepipeline = Codepipeline("CodePipeline")
+
+            project_resources.extend(
+                [bucket, kms, ssm, codepipeline, codebuild, sagemaker]
+            )
+            if approve_deployment:
+                # Like use-case C, only drawn for the first project.
+                (
+                    use_case_f
+                    >> Edge(
+                        label="(F) Manually approve deployment\nvia AWS "
+                        "CodePipeline console",
+                    )
+                    >> codepipeline
+                )
+                approve_deployment = False
 
-        resources - [
-            proj1_bucket,
-            proj1_kms,
-            proj1_ssm,
-            proj1_codepipeline,
-            proj1_codebuild,
-            proj1_sagemaker,
-            proj2_resources,
-        ]
+        resources - project_resources
 
 
 def make_use_case_a(
     fn="images/component_reference/A_deploy_infrastructure.png",
+    outformats=None,
 ):
     """Use-case A: As a Full-Stack Developer, deploy the initial infrastructure
     using CloudFormation (one-click deployment).
@@ -285,7 +816,7 @@ def make_use_case_a(
     diagram_kwargs = {
         "name": "",
         "filename": _filename,
-        "outformat": _outformat,
+        "outformat": outformats or _outformat,
         "show": False,
         # "curvestyle": "curved",
         # "curvestyle": "ortho",
@@ -296,7 +827,7 @@ def make_use_case_a(
 
     steps_a = count(1)
 
-    with Diagram(**diagram_kwargs):
+    with CachedDiagram(**diagram_kwargs):
         role = IAMRole("FullStackDeveloper")
 
         # full_stack_dev = User("Full Stack\nDeveloper")
@@ -311,10 +842,7 @@ def make_use_case_a(
         stackset_execution_role_stack = CloudformationStack(
             "stackset-execution-role"
         )
-        codeartifact = Custom(
-            "AWS CodeArtifact",
-            os.path.join(PWD, "images/logos/aws-codeartifact.png"),
-        )
+        codeartifact = make_codeartifact("AWS CodeArtifact")
 
         sm_tag_lambda_stack = CloudformationStack("sm-tag-lambda-stack")
         sc_project_stack = CloudformationStack("sc-project-stack")
@@ -539,6 +1067,7 @@ def make_use_case_a(
 
 def make_use_case_b(
     fn="images/component_reference/B_create_sagemaker_project.png",
+    outformats=None,
 ):
     """Use-case B: As a Data Science Admin (DataScienceAdmin role), create a
     SageMaker Project.
@@ -556,7 +1085,7 @@ def make_use_case_b(
     diagram_kwargs = {
         "name": "",
         "filename": _filename,
-        "outformat": _outformat,
+        "outformat": outformats or _outformat,
         "show": False,
         # "curvestyle": "curved",
         # "curvestyle": "ortho",
@@ -567,7 +1096,7 @@ def make_use_case_b(
 
     steps_b = count(1)
 
-    with Diagram(**diagram_kwargs):
+    with CachedDiagram(**diagram_kwargs):
         role = IAMRole("DataScienceAdmin")
         artifacts_bucket = S3(
             "ArtifactsBucket\n{account_id}-{region}-mlops-artifacts"
@@ -857,116 +1386,21 @@ def make_use_case_b(
             )
 
 
-def make_use_case_c(fn="images/component_reference/C_create_user.png"):
+def make_use_case_c(
+    fn="images/component_reference/C_create_user.png",
+    outformats=None,
+):
     """Use-case C: As a Data Science Admin (DataScienceAdmin role), create a
     user of the project for a data scientist.
 
     """
+    render_spec(SPEC_FILE, "C_create_user", fn, outformats)
 
-    graph_attr = {
-        "splines": "polylines"
-        # "splines": "spline"
-    }
-
-    _filename = os.path.splitext(fn)[0]
-    _outformat = os.path.splitext(fn)[1].lstrip(".").lower()
-
-    diagram_kwargs = {
-        "name": "",
-        "filename": _filename,
-        "outformat": _outformat,
-        "show": False,
-        # "curvestyle": "curved",
-        # "curvestyle": "ortho",
-        # "curvestyle": "splines",
-        "direction": "LR",
-        "graph_attr": graph_attr,
-    }
-
-    steps_c = count(1)
-
-    with Diagram(**diagram_kwargs):
-        role = IAMRole("DataScienceAdmin")
-
-        mlops_platform_repo = Codecommit(
-            "MlopsPlatformRepo\n"
-            "aws-enterprise-mlops-platform\n"
-            "(use-case A)\n"
-            "(codecommit)"
-        )
 
-        with Cluster(
-            "AWS Management Console",
-            graph_attr={
-                "fontcolor": "red",
-                "pencolor": "red",
-                "style": "dashed",
-                "bgcolor": "none",
-            },
-        ):
-            user_catalog_product = ServiceCatalog(
-                "{project_name}\nSageMaker\nStudio User\n"
-                "(service-catalog-product)"
-            )
-
-            (
-                role
-                >> Edge(label=f"C.{next(steps_c)} create user")
-                >> user_catalog_product
-            )
-
-        sm_studio_user = Sagemaker("SageMaker\nStudio\nUser")
-        sm_studio_domain = Sagemaker("SageMaker\nStudio\nDomain")
-
-        with Cluster("SC-{account_id}-pp-* Stack"):
-            user_stack = CloudformationStack(
-                "SageMaker Project\nUser Stack\n"
-                "SC-{account_id}-pp-*\n(cfn-stack)"
-            )
-
-            pipeline = Codepipeline(
-                "UserLCCPipeline\n{project_name}_{user}_pipeline\n"
-                "(codepipeline)"
-            )
-
-            (
-                user_catalog_product
-                >> Edge(label=f"C.{next(steps_c)} deploy")
-                >> user_stack
-            )
-
-            (
-                mlops_platform_repo
-                >> Edge(xlabel=f"C.{next(steps_c)} source stage")
-                >> pipeline
-            )
-
-            user_stack >> Edge(label="start\npipeline") >> pipeline
-
-            user_stack >> Edge(label="deploy") >> sm_studio_user
-
-            user_lcc_project = Codebuild(
-                "UserLifeCycleConfigProject\n"
-                "associate_user_lifecycle\n"
-                "(codebuild-action)"
-            )
-
-            (
-                pipeline
-                - Edge(label=f"C.{next(steps_c)} CreateAssociation\nstage")
-                >> user_lcc_project
-            )
-
-            user_lcc_project - Blank(
-                label=f"C.{next(steps_c)} associate\nuser w/ domain",
-                labelloc="",
-                height="0.5",
-            ) - Edge(style="dashed") >> [sm_studio_user, sm_studio_domain]
-
-    return
-
-
-def make_use_case_d(fn="images/component_reference/D_launch_sm_studio.png"):
+def make_use_case_d(
+    fn="images/component_reference/D_launch_sm_studio.png",
+    outformats=None,
+):
     """Use-case D: As a Data Scientist (DataScientist role), use SageMaker
     Studio to start model development.
 
@@ -983,7 +1417,7 @@ def make_use_case_d(fn="images/component_reference/D_launch_sm_studio.png"):
     diagram_kwargs = {
         "name": "",
         "filename": _filename,
-        "outformat": _outformat,
+        "outformat": outformats or _outformat,
         "show": False,
         # "curvestyle": "curved",
         # "curvestyle": "ortho",
@@ -994,7 +1428,7 @@ def make_use_case_d(fn="images/component_reference/D_launch_sm_studio.png"):
 
     steps_d = count(1)
 
-    with Diagram(**diagram_kwargs):
+    with CachedDiagram(**diagram_kwargs):
         proj_bucket = S3(
             "ProjectBucket\n{project_name}-{account_id}\n(use-case B)"
         )
@@ -1114,7 +1548,10 @@ def make_use_case_d(fn="images/component_reference/D_launch_sm_studio.png"):
     return
 
 
-def make_use_case_e(fn="images/component_reference/E_training.png"):
+def make_use_case_e(
+    fn="images/component_reference/E_training.png",
+    outformats=None,
+):
     """Use-case E: As a Data Scientist (DataScientist role), trigger the model
     building.
 
@@ -1131,7 +1568,7 @@ def make_use_case_e(fn="images/component_reference/E_training.png"):
     diagram_kwargs = {
         "name": "",
         "filename": _filename,
-        "outformat": _outformat,
+        "outformat": outformats or _outformat,
         "show": False,
         # "curvestyle": "curved",
         # "curvestyle": "ortho",
@@ -1142,7 +1579,7 @@ def make_use_case_e(fn="images/component_reference/E_training.png"):
 
     steps_e = count(1)
 
-    with Diagram(**diagram_kwargs):
+    with CachedDiagram(**diagram_kwargs):
         role = IAMRole("DataScientist")
 
         proj_repo = Codecommit(
@@ -1338,7 +1775,10 @@ def make_use_case_e(fn="images/component_reference/E_training.png"):
         sagemaker >> Edge(style="dashed") >> approval
 
 
-def make_use_case_f(fn="images/component_reference/F_approve_deployment.png"):
+def make_use_case_f(
+    fn="images/component_reference/F_approve_deployment.png",
+    outformats=None,
+):
     """Use-case F: As a Data Scientist (DataScientist role), approve the model
     deployment.
 
@@ -1355,7 +1795,7 @@ def make_use_case_f(fn="images/component_reference/F_approve_deployment.png"):
     diagram_kwargs = {
         "name": "",
         "filename": _filename,
-        "outformat": _outformat,
+        "outformat": outformats or _outformat,
         "show": False,
         # "curvestyle": "curved",
         # "curvestyle": "ortho",
@@ -1366,7 +1806,7 @@ def make_use_case_f(fn="images/component_reference/F_approve_deployment.png"):
 
     steps_f = count(1)
 
-    with Diagram(**diagram_kwargs):
+    with CachedDiagram(**diagram_kwargs):
         role = IAMRole("DataScientistRole")
 
         with Cluster(
@@ -1596,7 +2036,10 @@ def make_use_case_f(fn="images/component_reference/F_approve_deployment.png"):
         sm_monitor >> Edge(style="dashed") >> use_case_g
 
 
-def make_use_case_g(fn="images/component_reference/G_monitor_performance.png"):
+def make_use_case_g(
+    fn="images/component_reference/G_monitor_performance.png",
+    outformats=None,
+):
     """Use-case G: As a Data Scientist (DataScientist role), approve the model
     deployment.
 
@@ -1613,7 +2056,7 @@ def make_use_case_g(fn="images/component_reference/G_monitor_performance.png"):
     diagram_kwargs = {
         "name": "",
         "filename": _filename,
-        "outformat": _outformat,
+        "outformat": outformats or _outformat,
         "show": False,
         # "curvestyle": "curved",
         # "curvestyle": "ortho",
@@ -1624,7 +2067,7 @@ def make_use_case_g(fn="images/component_reference/G_monitor_performance.png"):
 
     steps_g = count(1)
 
-    with Diagram(**diagram_kwargs):
+    with CachedDiagram(**diagram_kwargs):
         ds_role = IAMRole("DataScientistRole")
 
         with Cluster(
@@ -1756,12 +2199,771 @@ def make_use_case_g(fn="images/component_reference/G_monitor_performance.png"):
     return
 
 
+BUILDERS = [
+    "make_high_level_architecture",
+    "make_use_case_a",
+    "make_use_case_b",
+    "make_use_case_c",
+    "make_use_case_d",
+    "make_use_case_e",
+    "make_use_case_f",
+    "make_use_case_g",
+]
+
+RenderResult = namedtuple(
+    "RenderResult",
+    ["name", "ok", "seconds", "error", "outputs", "assets", "profile"],
+)
+
+PROFILE_PHASES = ["construct", "dot", "layout", "encode"]
+
+
+def builder_names(names):
+    """Return the builders named by ``names``, with or without ``make_``."""
+    result = []
+    for name in names:
+        builder = name if name.startswith("make_") else f"make_{name}"
+        if builder not in BUILDERS:
+            choices = ", ".join(b[len("make_") :] for b in BUILDERS)
+            raise ValueError(
+                f"unknown diagram {name!r}, choose from {choices}"
+            )
+        result.append(builder)
+    return result
+
+
+def render_one(name, **kwargs):
+    """Run the diagram builder ``name`` and report its outcome and wall time.
+
+    ``kwargs``, e.g. ``fn``, are passed on to the builder. Failures are
+    captured instead of raised so that one broken diagram does not abort the
+    remaining ones.
+
+    """
+    del _rendered[:]
+    start = time.perf_counter()
+    try:
+        outformats = output_formats()
+        if "::" in name:
+            # A diagram of a spec file, named "<spec file>::<diagram>".
+            path, diagram = name.split("::", 1)
+            render_spec(path, diagram, outformats=outformats, **kwargs)
+        else:
+            globals()[name](outformats=outformats, **kwargs)
+    except Exception:
+        return RenderResult(
+            name,
+            False,
+            time.perf_counter() - start,
+            traceback.format_exc(),
+            [],
+            [],
+            None,
+        )
+    seconds = time.perf_counter() - start
+    outputs = [path for entry in _rendered for path in entry["outputs"]]
+    assets = sorted({path for entry in _rendered for path in entry["assets"]})
+    keys = PROFILE_PHASES + ["nodes", "edges", "layouts", "timeouts"]
+    profile = {
+        key: sum(entry["profile"][key] for entry in _rendered) for key in keys
+    }
+    profile["total"] = seconds
+    return RenderResult(name, True, seconds, None, outputs, assets, profile)
+
+
+def render_all(names=None, jobs=1):
+    """Render the diagrams ``names`` (default: all of :data:`BUILDERS`).
+
+    With ``jobs > 1`` every builder runs in its own worker process, so the
+    Graphviz layouts overlap and the total time approaches that of the slowest
+    diagram. ``jobs=0`` uses one worker per CPU. Results are returned in the
+    order of ``names``.
+
+    """
+    names = list(names or BUILDERS)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(names))
+    if jobs <= 1:
+        return [render_one(name) for name in names]
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(render_one, name): name for name in names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception:
+                results[name] = _crashed(name)
+    return [results[name] for name in names]
+
+
+def check_cache(names=None, jobs=1):
+    """Render the diagrams ``names`` twice, into an empty render cache.
+
+    The images are written to a temporary directory. Returns the results of
+    the second run that ran Graphviz again although nothing changed, i.e.
+    whose fingerprint differs from one run to the next, or that failed.
+
+    """
+    names = list(names or BUILDERS)
+    cache_dir = os.environ.get("DIAGRAM_CACHE_DIR")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DIAGRAM_CACHE_DIR"] = os.path.join(tmp, "cache")
+        try:
+            # Every run starts new worker processes, like a new invocation.
+            for _ in range(2):
+                with ProcessPoolExecutor(max_workers=jobs or None) as pool:
+                    futures = [
+                        pool.submit(
+                            render_one,
+                            name,
+                            fn=os.path.join(tmp, f"{idx}.png"),
+                        )
+                        for idx, name in enumerate(names)
+                    ]
+                    results = [future.result() for future in futures]
+        finally:
+            if cache_dir is None:
+                del os.environ["DIAGRAM_CACHE_DIR"]
+            else:
+                os.environ["DIAGRAM_CACHE_DIR"] = cache_dir
+    return [
+        result
+        for result in results
+        if not result.ok or result.profile["layouts"]
+    ]
+
+
+def _crashed(name):
+    """Report a worker process that died while rendering ``name``.
+
+    Call this from an ``except`` block: the worker itself died (e.g. killed
+    by the OOM killer), so render_one() had no chance to report it.
+
+    """
+    return RenderResult(
+        name, False, float("nan"), traceback.format_exc(), [], [], None
+    )
+
+
+TENANT_KEYS = {"account_id", "projects"}
+_ACCOUNT_ID_RE = re.compile(r"[\w.-]+\Z")
+
+
+def _tenant(account_id, projects, where):
+    account_id = str(account_id)
+    if not _ACCOUNT_ID_RE.match(account_id):
+        raise ValueError(f"{where}: bad account id {account_id!r}")
+    if not isinstance(projects, dict):
+        raise ValueError(f"{where}: projects must map names to users")
+    return account_id, projects
+
+
+def _json_tenant(tenant, where):
+    if not isinstance(tenant, dict) or not TENANT_KEYS <= tenant.keys():
+        raise ValueError(f"{where}: an account needs account_id and projects")
+    return _tenant(tenant["account_id"], tenant["projects"], where)
+
+
+def _read_csv_inventory(f, path):
+    reader = csv.DictReader(f)
+    missing = {"account_id", "project"} - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"{path}: missing columns {sorted(missing)}")
+    seen = set()
+    for account_id, rows in groupby(reader, key=lambda row: row["account_id"]):
+        if account_id in seen:
+            raise ValueError(
+                f"{path}:{reader.line_num}: the rows of account "
+                f"{account_id!r} are not contiguous"
+            )
+        seen.add(account_id)
+        projects = {}
+        for row in rows:
+            users = projects.setdefault(row["project"], [])
+            if row.get("user"):
+                users.append(row["user"])
+        yield _tenant(account_id, projects, path)
+
+
+def read_inventory(path):
+    """Yield ``(account_id, projects)`` for every account of an inventory.
+
+    ``projects`` maps project names to user names, as the ``projects``
+    argument of :func:`make_high_level_architecture`. The inventory is read
+    lazily, one account at a time. It is either
+
+    * a CSV file with the columns ``account_id``, ``project`` and,
+      optionally, ``user``, with one row per user (or per project without
+      users), and the rows of each account next to each other;
+    * a JSON Lines file (``.jsonl`` or ``.ndjson``) with one
+      ``{"account_id": ..., "projects": {project: [user, ...]}}`` object
+      per line;
+    * a JSON file with a list of such objects, which is loaded at once.
+
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, newline="" if ext == ".csv" else None) as f:
+        if ext == ".csv":
+            yield from _read_csv_inventory(f, path)
+        elif ext in (".jsonl", ".ndjson"):
+            for lineno, line in enumerate(f, 1):
+                if line.strip():
+                    yield _json_tenant(json.loads(line), f"{path}:{lineno}")
+        elif ext == ".json":
+            for tenant in json.load(f):
+                yield _json_tenant(tenant, path)
+        else:
+            raise ValueError(f"{path}: unknown inventory format {ext!r}")
+
+
+def render_tenant(account_id, projects, out_dir):
+    """Render the high-level architecture of one account into ``out_dir``."""
+    result = render_one(
+        "make_high_level_architecture",
+        fn=os.path.join(out_dir, f"{account_id}.png"),
+        projects=projects,
+        account_id=account_id,
+    )
+    return result._replace(name=account_id)
+
+
+def render_inventory(path, out_dir, jobs=1):
+    """Render one architecture diagram per account of the inventory ``path``.
+
+    Results are yielded as the diagrams complete. The inventory is streamed:
+    at most two accounts per worker are read ahead, so memory use does not
+    grow with the size of the inventory. ``jobs=0`` uses one worker per CPU.
+
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tenants = read_inventory(path)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1:
+        for account_id, projects in tenants:
+            yield render_tenant(account_id, projects, out_dir)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = {}
+        for account_id, projects in tenants:
+            if len(pending) >= 2 * jobs:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield _tenant_result(future, pending.pop(future))
+            future = pool.submit(render_tenant, account_id, projects, out_dir)
+            pending[future] = account_id
+        for future in as_completed(pending):
+            yield _tenant_result(future, pending[future])
+
+
+def _tenant_result(future, account_id):
+    try:
+        return future.result()
+    except Exception:
+        return _crashed(account_id)
+
+
+def _global_names(code):
+    yield from code.co_names
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            yield from _global_names(const)
+
+
+def builder_source(name):
+    """Return the source of builder ``name`` and its first and last line.
+
+    The source also includes the module-level helper functions the builder
+    calls, e.g. :func:`make_dot`, since they shape the diagram as well.
+
+    """
+    fn = globals()[name]
+    lines, first = inspect.getsourcelines(fn)
+    sources = ["".join(lines)]
+    for helper in sorted(set(_global_names(fn.__code__))):
+        obj = globals().get(helper)
+        if inspect.isfunction(obj) and obj.__module__ == fn.__module__:
+            sources.append(inspect.getsource(obj))
+    return "\n".join(sources), [first, first + len(lines) - 1]
+
+
+def _relpath(path):
+    """Return the manifest key of ``path``, see :data:`DIAGRAMS_ROOT`."""
+    path = os.path.abspath(path)
+    if path.startswith(PWD + os.sep):
+        return os.path.relpath(path, PWD)
+    if path.startswith(DIAGRAMS_ROOT + os.sep):
+        key = os.path.relpath(path, DIAGRAMS_ROOT).replace(os.sep, "/")
+        return DIAGRAMS_PREFIX + key
+    return path
+
+
+def _abspath(key):
+    """Return the path of the manifest key ``key``."""
+    if key.startswith(DIAGRAMS_PREFIX):
+        return os.path.join(DIAGRAMS_ROOT, key[len(DIAGRAMS_PREFIX) :])
+    # Absolute paths are kept as is by os.path.join().
+    return os.path.join(PWD, key)
+
+
+def _diagrams_version():
+    return importlib.metadata.version("diagrams")
+
+
+def _file_digests(paths):
+    digests = {}
+    for path in paths:
+        try:
+            digests[_relpath(path)] = _file_digest(path)
+        except FileNotFoundError:
+            # A missing icon, see _icon_digest().
+            digests[_relpath(path)] = "missing"
+    return digests
+
+
+def _changed_file(digests):
+    for key, digest in sorted(digests.items()):
+        path = _abspath(key)
+        if not os.path.exists(path):
+            if digest != "missing":
+                return f"{key} is missing"
+        elif _file_digest(path) != digest:
+            return f"{key} changed"
+    return None
+
+
+def load_manifest(path=DEFAULT_MANIFEST):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=DEFAULT_MANIFEST):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def stale_builders(names, manifest):
+    """Return ``{name: reason}`` for the builders that must be re-run.
+
+    A builder is stale when it has no manifest entry yet, when its source (or
+    that of a helper it calls) changed, when the ``diagrams`` package was
+    upgraded, when it was rendered with other :func:`render_options`, e.g.
+    other formats, when one of its assets (icon files and spec files)
+    changed, or when one of its output images is missing or was modified.
+
+    """
+    stale = {}
+    for name in names:
+        entry = manifest.get(name)
+        if entry is None:
+            stale[name] = "not built yet"
+            continue
+        source, _ = builder_source(name)
+        if hashlib.sha256(source.encode()).hexdigest() != entry["source"]:
+            stale[name] = "source changed"
+            continue
+        if entry.get("diagrams") != _diagrams_version():
+            stale[name] = "diagrams package changed"
+            continue
+        if entry.get("options") != render_options():
+            stale[name] = "render options changed"
+            continue
+        reason = _changed_file(entry["assets"]) or _changed_file(
+            entry["outputs"]
+        )
+        if reason:
+            stale[name] = reason
+    return stale
+
+
+def update_manifest(manifest, results):
+    """Record the inputs and outputs of the builders that rendered fine.
+
+    Failed builders, and builders rendered as drafts after a layout timeout,
+    are dropped from the manifest, so that they are retried on the next run.
+
+    """
+    for result in results:
+        if not result.ok or result.profile["timeouts"]:
+            manifest.pop(result.name, None)
+            continue
+        source, lines = builder_source(result.name)
+        manifest[result.name] = {
+            "lines": lines,
+            "source": hashlib.sha256(source.encode()).hexdigest(),
+            "diagrams": _diagrams_version(),
+            "options": render_options(),
+            "assets": _file_digests(result.assets),
+            "outputs": _file_digests(result.outputs),
+        }
+    return manifest
+
+
+def _reload():
+    """Re-execute this script in place, keeping the imported packages.
+
+    The builders and helpers are redefined from the current source, without
+    importing ``diagrams`` again. If the script is broken, the error is
+    printed and the previous definitions are kept.
+
+    """
+    path = os.path.abspath(__file__)
+    namespace = globals()
+    name = namespace["__name__"]
+    try:
+        with open(path) as f:
+            code = compile(f.read(), path, "exec")
+        # Keep inspect.getsource(), and thus builder_source(), up to date.
+        linecache.checkcache(path)
+        # Skip the "if __name__ == '__main__'" block of the script.
+        namespace["__name__"] = "make_diagrams"
+        exec(code, namespace)
+    except Exception:
+        traceback.print_exc()
+        return False
+    finally:
+        namespace["__name__"] = name
+    return True
+
+
+def _mtimes(manifest):
+    """Return the mtimes of this script and of the assets in ``manifest``."""
+    paths = {os.path.abspath(__file__)}
+    for entry in manifest.values():
+        paths.update(_abspath(key) for key in entry["assets"])
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtimes[path] = None
+    return mtimes
+
+
+def watch(names=None, manifest_path=DEFAULT_MANIFEST, interval=0.5):
+    """Re-render the diagrams whenever this script or their assets change.
+
+    This script and the icon and spec files recorded in the manifest are
+    polled every ``interval`` seconds. When this script changes, it is
+    re-executed in place by :func:`_reload`; then, as in an incremental build,
+    only the stale builders among ``names`` (default: all of
+    :data:`BUILDERS`) are re-run. They run in this process, so that neither
+    ``diagrams`` nor the script are imported again. Runs until interrupted.
+
+    """
+    script = os.path.abspath(__file__)
+    mtimes = {}
+    print(f"watching {_relpath(script)} and the diagram assets")
+    while True:
+        manifest = load_manifest(manifest_path)
+        current = _mtimes(manifest)
+        if current != mtimes:
+            if mtimes and current[script] != mtimes[script] and not _reload():
+                # Wait for the script to be fixed.
+                mtimes = current
+                continue
+            _icon_digest.cache_clear()
+            start = time.perf_counter()
+            try:
+                stale = stale_builders(names or BUILDERS, manifest)
+                results = []
+                for name, reason in stale.items():
+                    print(f"stale   {name}: {reason}")
+                    results.append(render_one(name))
+                    print_result(results[-1])
+                if results:
+                    print_results(
+                        results, time.perf_counter() - start, progress=False
+                    )
+                update_manifest(manifest, results)
+                save_manifest(manifest, manifest_path)
+            except Exception:
+                traceback.print_exc()
+            mtimes = _mtimes(manifest)
+        else:
+            time.sleep(interval)
+
+
+def print_result(result, file=sys.stdout):
+    if not result.ok:
+        status = "FAILED"
+    elif result.profile["timeouts"]:
+        status = "draft"
+    else:
+        status = "ok"
+    print(f"{status:<8}{result.seconds:8.2f}s  {result.name}", file=file)
+
+
+def print_results(results, wall_time, file=sys.stdout, progress=True):
+    """Print the outcome of every result, then the failures in full.
+
+    Pass ``progress=False`` if every result was already printed with
+    :func:`print_result` as it completed.
+
+    """
+    if progress:
+        for result in results:
+            print_result(result, file)
+    print(f"{'total':<8}{wall_time:8.2f}s", file=file)
+    for result in results:
+        if not result.ok:
+            print(f"\n--- {result.name} ---\n{result.error}", file=file)
+
+
+def print_profile(results, file=sys.stdout):
+    """Print the time spent per phase, and the size, of every diagram.
+
+    ``construct`` is the time spent creating the ``diagrams`` objects,
+    ``dot`` generating the DOT source, ``layout`` running the Graphviz layout
+    and ``encode`` writing the images. Layout and encode are zero when the
+    images came from the render cache.
+
+    """
+    columns = PROFILE_PHASES + ["total"]
+    print(
+        f"{'diagram':<30}"
+        + "".join(f"{column:>11}" for column in columns)
+        + f"{'nodes':>8}{'edges':>8}",
+        file=file,
+    )
+    for result in results:
+        if not result.ok:
+            continue
+        profile = result.profile
+        print(
+            f"{result.name:<30}"
+            + "".join(f"{profile[column]:10.3f}s" for column in columns)
+            + f"{profile['nodes']:8d}{profile['edges']:8d}",
+            file=file,
+        )
+
+
+def write_profile(results, path):
+    """Write the profile of every rendered diagram to ``path`` as JSON."""
+    report = [
+        dict(result.profile, name=result.name)
+        for result in results
+        if result.ok
+    ]
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render the component reference diagrams."
+    )
+    parser.add_argument(
+        "-B",
+        "--force",
+        action="store_true",
+        help="re-run every builder, even if its inputs did not change",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=DEFAULT_MANIFEST,
+        help="dependency manifest used for incremental builds",
+    )
+    parser.add_argument(
+        "--only",
+        action="append",
+        metavar="NAME",
+        help="only consider the diagram NAME, e.g. use_case_e (repeatable)",
+    )
+    parser.add_argument(
+        "--spec",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help="render every diagram of the spec file FILE instead of the "
+        "builders of this script (repeatable)",
+    )
+    parser.add_argument(
+        "--inventory",
+        metavar="FILE",
+        help="render the high-level architecture of every account of the "
+        "tenant inventory FILE (CSV, JSON or JSON Lines) instead of the "
+        "builders of this script",
+    )
+    parser.add_argument(
+        "--out-dir",
+        default=DEFAULT_TENANT_DIR,
+        help="directory the diagrams of --inventory are written to "
+        f"(default: {DEFAULT_TENANT_DIR})",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["diagrams", "dot"],
+        help="how to build the diagrams of spec files: with the diagrams "
+        "package (default), or by emitting DOT directly; the builders of "
+        "this script and --inventory always use the diagrams package",
+    )
+    parser.add_argument(
+        "--formats",
+        help="comma-separated output formats, e.g. png,svg,pdf, rendered from "
+        f"a single layout (default: {DEFAULT_FORMATS})",
+    )
+    parser.add_argument(
+        "--draft-threshold",
+        type=int,
+        metavar="N",
+        help="render graphs with more than N nodes plus edges as drafts, "
+        "with straight edges (default: 0, never)",
+    )
+    parser.add_argument(
+        "--draft-engine",
+        help="Graphviz layout engine of drafts, e.g. sfdp (default: the "
+        "engine of the diagram)",
+    )
+    parser.add_argument(
+        "--layout-timeout",
+        type=float,
+        metavar="SECONDS",
+        help="render a draft instead if a layout takes longer "
+        f"(default: {DEFAULT_LAYOUT_TIMEOUT}, 0 to wait forever)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always run Graphviz, ignoring the render cache",
+    )
+    parser.add_argument(
+        "--check-cache",
+        action="store_true",
+        help="render the diagrams twice into an empty render cache, and fail "
+        "unless the second run restores every image from the cache",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="time the phases of every diagram, print them as a table and "
+        "write them to FILE as JSON",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running, and re-render the diagrams whose builder or "
+        "assets change",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of diagrams to render in parallel (0: one per CPU)",
+    )
+    return parser.parse_args(argv)
+
+
+def main_inventory(args):
+    """Render the diagrams of the tenant inventory ``args.inventory``."""
+    if args.backend == "dot":
+        print(
+            "warning --backend dot only applies to --spec, tenant diagrams "
+            "are built with the diagrams package",
+            file=sys.stderr,
+        )
+    start = time.perf_counter()
+    results = []
+    try:
+        for result in render_inventory(
+            args.inventory, args.out_dir, jobs=args.jobs
+        ):
+            print_result(result)
+            results.append(result)
+    except (OSError, ValueError) as e:
+        print(f"error   {e}")
+        return 1
+    print_results(results, time.perf_counter() - start, progress=False)
+    if args.profile:
+        print()
+        print_profile(results)
+        write_profile(results, args.profile)
+    return 0 if all(result.ok for result in results) else 1
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Options are passed through the environment, so that worker processes
+    # pick them up, too.
+    if args.formats:
+        os.environ["DIAGRAM_FORMATS"] = args.formats
+    if args.backend:
+        os.environ["DIAGRAM_BACKEND"] = args.backend
+    if args.draft_threshold is not None:
+        os.environ["DIAGRAM_DRAFT_THRESHOLD"] = str(args.draft_threshold)
+    if args.draft_engine:
+        os.environ["DIAGRAM_DRAFT_ENGINE"] = args.draft_engine
+    if args.layout_timeout is not None:
+        os.environ["DIAGRAM_LAYOUT_TIMEOUT"] = str(args.layout_timeout)
+    if args.no_cache:
+        os.environ["DIAGRAM_CACHE_DIR"] = ""
+    if args.profile:
+        os.environ["DIAGRAM_PROFILE"] = "1"
+
+    if args.inventory:
+        return main_inventory(args)
+    try:
+        builders = builder_names(args.only) if args.only else BUILDERS
+    except ValueError as e:
+        print(f"error   {e}")
+        return 2
+    if args.watch:
+        try:
+            watch(builders, args.manifest)
+        except KeyboardInterrupt:
+            return 0
+    if args.check_cache:
+        failed = check_cache(builders, args.jobs)
+        for result in failed:
+            status = "FAILED" if not result.ok else "miss"
+            print(f"{status:<8}{result.name}")
+        print(
+            f"{len(builders) - len(failed)} of {len(builders)} diagrams were "
+            "restored from the render cache"
+        )
+        return 1 if failed else 0
+    if args.spec:
+        names = [
+            f"{path}::{name}"
+            for path in args.spec
+            for name in diagram_spec.load_spec(path)
+        ]
+        manifest = None
+    else:
+        manifest = load_manifest(args.manifest)
+        if args.force:
+            stale = dict.fromkeys(builders, "forced")
+        else:
+            stale = stale_builders(builders, manifest)
+        if not stale:
+            print(f"all {len(builders)} diagrams are up to date")
+            return 0
+        for name, reason in stale.items():
+            print(f"stale   {name}: {reason}")
+        names = list(stale)
+
+    start = time.perf_counter()
+    results = render_all(names, jobs=args.jobs)
+    print_results(results, time.perf_counter() - start)
+    if manifest is not None:
+        save_manifest(update_manifest(manifest, results), args.manifest)
+    if args.profile:
+        print()
+        print_profile(results)
+        write_profile(results, args.profile)
+    return 0 if all(result.ok for result in results) else 1
+
+
 if __name__ == "__main__":
-    make_high_level_architecture()
-    make_use_case_a()
-    make_use_case_b()
-    make_use_case_c()
-    make_use_case_d()
-    make_use_case_e()
-    make_use_case_f()
-    make_use_case_g()
+    sys.exit(main())